@@ -0,0 +1,366 @@
+"""Local HTTP API for Simplify.
+
+Exposes the summarize and chat capabilities over plain HTTP/1.1 so other
+tools can call them:
+
+    POST /ingest     {"name": "paper.txt", "text": "..."} or {"path": "uploads/paper.pdf"}
+    POST /summarize  {"documents": ["paper.txt"], "sentences": 5}
+    POST /query      {"query": "...", "k": 5, "budget_ms": 150}
+    POST /batch      {"questions": ["...", "..."], "documents": ["paper.txt"], "k": 3}
+    GET  /usage
+    GET  /health
+
+All connections share one in-process Corpus. When the server is given a
+WorkspaceManager, requests may carry a "workspace" field to target that
+tenant's corpus instead; ingests into a workspace are checked against its
+quotas.
+
+Connections are kept alive between requests, at most `max_concurrency`
+requests are handled at once, and once `max_pending` requests are waiting
+new ones get a 503 instead of piling up in memory.
+
+Run with: python simplify_api.py --port 8765
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from simplify_batch import run_batch
+from simplify_corpus import Corpus
+from simplify_retrieval import answer_from_hits, planner_for
+from simplify_workspaces import QuotaExceeded, WorkspaceManager
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+MAX_HEADER_LINES = 100
+IDLE_TIMEOUT = 30.0
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           408: "Request Timeout", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable", 507: "Insufficient Storage"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _integer(payload, key, default, minimum=1):
+    """An integer request field, or a 400"""
+    value = payload.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise HTTPError(400, f"'{key}' must be an integer of at least {minimum}")
+    return value
+
+def _number(payload, key, minimum=0):
+    """An optional finite number request field, or a 400"""
+    value = payload.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) \
+            or not math.isfinite(value) or value < minimum:
+        raise HTTPError(400, f"'{key}' must be a number of at least {minimum}")
+    return float(value)
+
+def _string(payload, key):
+    """An optional string request field, or a 400"""
+    value = payload.get(key)
+    if value is not None and not isinstance(value, str):
+        raise HTTPError(400, f"'{key}' must be a string")
+    return value
+
+def _names(payload, key="documents"):
+    """An optional list of document names, or a 400"""
+    value = payload.get(key)
+    if value is not None and (not isinstance(value, list) or not all(isinstance(n, str) for n in value)):
+        raise HTTPError(400, f"'{key}' must be a list of strings")
+    return value
+
+
+class SimplifyAPI:
+    """asyncio HTTP server over a shared Corpus"""
+
+    def __init__(self, corpus=None, max_concurrency=8, max_pending=64, upload_dir="uploads",
+                 workspaces=None):
+        self.corpus = corpus if corpus is not None else Corpus()
+        self.workspaces = workspaces
+        self.upload_dir = upload_dir
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._ingest_lock = asyncio.Lock()
+        self._pending = 0
+        self._server = None
+        self.routes = {
+            ("POST", "/ingest"): self.handle_ingest,
+            ("POST", "/summarize"): self.handle_summarize,
+            ("POST", "/query"): self.handle_query,
+            ("POST", "/batch"): self.handle_batch,
+            ("GET", "/usage"): self.handle_usage,
+            ("GET", "/health"): self.handle_health,
+        }
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Start listening; port 0 picks a free port"""
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # Connection handling
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as e:
+                    await self._respond(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                except ValueError:
+                    # readline() refuses a line longer than the stream limit
+                    await self._respond(writer, 400, {"error": "Malformed request"}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self._dispatch(method, path, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(400, "Too many headers")
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method, path, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.routes):
+                return 405, {"error": f"{method} not allowed on {path}"}
+            return 404, {"error": f"No route for {path}"}
+
+        # Backpressure: refuse instead of queueing without bound
+        if self._pending >= self.max_pending:
+            return 503, {"error": "Server busy, retry later"}
+        self._pending += 1
+        try:
+            async with self._slots:
+                payload = json.loads(body) if body else {}
+                if not isinstance(payload, dict):
+                    raise HTTPError(400, "Request body must be a JSON object")
+                return 200, await handler(payload)
+        except json.JSONDecodeError:
+            return 400, {"error": "Request body is not valid JSON"}
+        except HTTPError as e:
+            return e.status, {"error": e.message}
+        except QuotaExceeded as e:
+            return 507, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+        finally:
+            self._pending -= 1
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def _corpus_for(self, payload):
+        workspace_id = _string(payload, "workspace")
+        if workspace_id is None:
+            return self.corpus
+        if self.workspaces is None:
+            raise HTTPError(400, "This server was started without workspaces")
+        loop = asyncio.get_running_loop()
+        try:
+            # May load an evicted index back from disk
+            return await loop.run_in_executor(None, self.workspaces.corpus, workspace_id)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    # Endpoints
+    async def handle_health(self, payload):
+        return {"status": "ok", "documents": len(self.corpus.documents), "chunks": len(self.corpus)}
+
+    async def handle_usage(self, payload):
+        if self.workspaces is None:
+            return {"workspaces": [], "resident_bytes": self.corpus.memory_bytes}
+        return self.workspaces.usage()
+
+    async def handle_ingest(self, payload):
+        name = _string(payload, "name")
+        for key in ("workspace", "text", "path"):
+            _string(payload, key)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if payload.get("workspace") is not None:
+            return await self._ingest_workspace(payload, start)
+        # Parsing is CPU/IO bound, keep it off the event loop; serialize writers
+        async with self._ingest_lock:
+            if "text" in payload:
+                if not name:
+                    raise HTTPError(400, "'name' is required with 'text'")
+                ids = await loop.run_in_executor(None, self.corpus.add_document, name, payload["text"])
+            elif "path" in payload:
+                path = self._resolve_upload(payload["path"])
+                try:
+                    ids = await loop.run_in_executor(None, self.corpus.add_file, path, name)
+                except ValueError as e:
+                    raise HTTPError(400, str(e))
+                name = name or os.path.basename(path)
+            else:
+                raise HTTPError(400, "Provide either 'text' or 'path'")
+        return {"name": name, "chunks": len(ids),
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    async def _ingest_workspace(self, payload, start):
+        if self.workspaces is None:
+            raise HTTPError(400, "This server was started without workspaces")
+        workspace_id, name = _string(payload, "workspace"), payload.get("name")
+        loop = asyncio.get_running_loop()
+        try:
+            if "text" in payload:
+                if not name:
+                    raise HTTPError(400, "'name' is required with 'text'")
+                ids = await loop.run_in_executor(
+                    None, self.workspaces.ingest_text, workspace_id, name, payload["text"])
+            elif "path" in payload:
+                # A workspace upload is indexed under its file name
+                if name and name != os.path.basename(payload["path"]):
+                    raise HTTPError(400, "'name' must match the upload's file name with 'path' in a workspace")
+                name = os.path.basename(payload["path"])
+                ids = await loop.run_in_executor(
+                    None, self.workspaces.ingest_file, workspace_id, payload["path"])
+            else:
+                raise HTTPError(400, "Provide either 'text' or 'path'")
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        except FileNotFoundError as e:
+            raise HTTPError(404, str(e))
+        return {"workspace": workspace_id, "name": name, "chunks": len(ids),
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    async def handle_summarize(self, payload):
+        corpus = (await self._corpus_for(payload)).snapshot()
+        names = _names(payload)
+        sentences = _integer(payload, "sentences", 5)
+        missing = [n for n in names or [] if corpus.resolve(n) not in corpus.documents]
+        if missing:
+            raise HTTPError(404, f"Unknown documents: {', '.join(missing)}")
+        loop = asyncio.get_running_loop()
+        summary = await loop.run_in_executor(None, corpus.summarize, names, sentences)
+        return {"summary": summary}
+
+    async def handle_query(self, payload):
+        query = (_string(payload, "query") or "").strip()
+        if not query:
+            raise HTTPError(400, "'query' is required")
+        k, budget_ms, names = _integer(payload, "k", 5), _number(payload, "budget_ms"), _names(payload)
+        corpus = await self._corpus_for(payload)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result = await loop.run_in_executor(
+            None, lambda: planner_for(corpus).retrieve(query, k, budget_ms, names))
+        return {"query": query, "answer": answer_from_hits(result.corpus, query, result.hits),
+                "citations": result.corpus.citations(result.hits),
+                "stages": result.stages, "degraded": result.degraded,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    async def handle_batch(self, payload):
+        questions = payload.get("questions")
+        if not isinstance(questions, list) or not any(isinstance(q, str) and q.strip() for q in questions):
+            raise HTTPError(400, "'questions' must be a non-empty list of strings")
+        if not all(isinstance(q, str) for q in questions):
+            raise HTTPError(400, "'questions' must be a non-empty list of strings")
+        names, k = _names(payload), _integer(payload, "k", 3)
+        corpus = (await self._corpus_for(payload)).snapshot()
+        missing = [n for n in names or [] if corpus.resolve(n) not in corpus.documents]
+        if missing:
+            raise HTTPError(404, f"Unknown documents: {', '.join(missing)}")
+        loop = asyncio.get_running_loop()
+        table = await loop.run_in_executor(None, run_batch, corpus, questions, names, k)
+        return {"rows": table.to_records(), "summary": table.summary(),
+                "elapsed_ms": table.elapsed_ms}
+
+    def _resolve_upload(self, path):
+        root = os.path.realpath(self.upload_dir)
+        full = os.path.realpath(os.path.join(root, path) if not os.path.isabs(path) else path)
+        if os.path.commonpath([root, full]) != root:
+            raise HTTPError(400, "Path must be inside the uploads directory")
+        if not os.path.isfile(full):
+            raise HTTPError(404, f"No such file: {path}")
+        return full
+
+
+async def main(host, port, max_concurrency, max_pending, workspace_root=None):
+    workspaces = WorkspaceManager(workspace_root) if workspace_root else None
+    api = SimplifyAPI(max_concurrency=max_concurrency, max_pending=max_pending,
+                      workspaces=workspaces)
+    host, port = await api.start(host, port)
+    print(f"Simplify API listening on http://{host}:{port}")
+    try:
+        await api.serve_forever()
+    finally:
+        if workspaces is not None:
+            workspaces.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simplify local HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--workspaces", metavar="DIR",
+                        help="enable per-tenant workspaces stored under DIR")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.max_concurrency, args.max_pending,
+                     args.workspaces))
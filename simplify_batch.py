@@ -0,0 +1,345 @@
+"""Batch question answering across documents.
+
+Analysts ask the same structured questions of every paper in a workspace.
+run_batch answers a question set against each document and returns an
+AnswerTable with one row per (document, question): the extracted answer,
+the first number and unit in it, and the citations it came from.
+
+Asking through the planner once per pair would score the whole corpus
+N x M times, because the planner's document filter is applied after
+scoring. Here each question is scored once over all chunks, lexically
+and densely, and those scores are split by document. Fusion, re-ranking
+and answer extraction then run per document on its own short candidate
+list. A passage a document shares with another is indexed only once, so
+each document is credited with, and cites, its own copy of it.
+
+AnswerTable keeps its columns as lists and typed arrays, so filters,
+comparisons and per-question aggregates run over columns without
+building a dict per row. to_pandas() and to_arrow() hand the same
+columns to pandas or pyarrow when they are installed; to_csv() needs
+neither.
+
+    python simplify_batch.py --workspace team-a --questions questions.txt --csv answers.csv
+"""
+import argparse
+import csv
+import heapq
+import json
+import math
+import re
+import time
+from array import array
+from operator import mul
+from simplify_corpus import embed, tokenize
+from simplify_retrieval import CANDIDATES, RERANK_TOP, RRF_K, answer_from_hits, \
+    reciprocal_rank_fusion, rerank_score
+
+ANSWER_SENTENCES = 2
+
+# First number in an answer, with the unit right after it when there is one
+VALUE_RE = re.compile(
+    r"(?<![\w.])(-?\d+(?:,\d{3})*(?:\.\d+)?)\s*"
+    r"(%|percent\b|wt\s?%|ppm\b|ppb\b|°C|[kmµμn]?(?:g|l|L|m|M|mol|Gy|Sv)(?:/[A-Za-z]+)?\b"
+    r"|(?:days?|weeks?|months?|years?|hours?|minutes?|seconds?)\b)?"
+)
+
+COLUMNS = ("document", "question", "answer", "value", "unit", "score", "pages", "citations")
+NUMERIC = ("value", "score")
+EXPORTED = ("document", "question", "answer", "value", "unit", "score", "pages", "sources")
+
+
+def extract_value(text):
+    """First number in text and its unit: (float, unit) or (nan, "")"""
+    match = VALUE_RE.search(text or "")
+    if not match:
+        return math.nan, ""
+    return float(match.group(1).replace(",", "")), (match.group(2) or "").strip()
+
+
+class AnswerTable:
+    """Column-oriented batch answers: one row per (document, question)"""
+
+    def __init__(self):
+        self.columns = {name: array("d") if name in NUMERIC else [] for name in COLUMNS}
+        self.elapsed_ms = 0.0
+
+    def __len__(self):
+        return len(self.columns["document"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def append(self, **row):
+        for name in COLUMNS:
+            self.columns[name].append(row[name])
+
+    def rows(self):
+        """Rows as dicts, in table order"""
+        names = list(self.columns)
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+    @property
+    def documents(self):
+        return list(dict.fromkeys(self.columns["document"]))
+
+    @property
+    def questions(self):
+        return list(dict.fromkeys(self.columns["question"]))
+
+    # Filtering
+    def take(self, indices):
+        """A new table holding the given rows"""
+        table = AnswerTable()
+        for name, column in self.columns.items():
+            table.columns[name].extend(column[i] for i in indices)
+        return table
+
+    def where(self, documents=None, questions=None, answered=None, min_score=None,
+              min_value=None, max_value=None, contains=None):
+        """Rows matching every given condition"""
+        keep = range(len(self))
+        cols = self.columns
+        if documents is not None:
+            documents = set(documents)
+            keep = [i for i in keep if cols["document"][i] in documents]
+        if questions is not None:
+            questions = set(questions)
+            keep = [i for i in keep if cols["question"][i] in questions]
+        if answered is not None:
+            keep = [i for i in keep if bool(cols["answer"][i]) == answered]
+        if min_score is not None:
+            keep = [i for i in keep if cols["score"][i] >= min_score]
+        # NaN compares false, so rows without a value drop out of range filters
+        if min_value is not None:
+            keep = [i for i in keep if cols["value"][i] >= min_value]
+        if max_value is not None:
+            keep = [i for i in keep if cols["value"][i] <= max_value]
+        if contains:
+            needle = contains.lower()
+            keep = [i for i in keep if needle in cols["answer"][i].lower()]
+        return self.take(keep)
+
+    # Comparison and aggregation
+    def _groups(self, name):
+        groups = {}
+        for i, key in enumerate(self.columns[name]):
+            groups.setdefault(key, []).append(i)
+        return groups
+
+    def pivot(self, values="answer"):
+        """{document: {question: value}} for side-by-side comparison"""
+        table = {}
+        column = self.columns[values]
+        for document, question, value in zip(self.columns["document"], self.columns["question"], column):
+            table.setdefault(document, {})[question] = value
+        return table
+
+    def compare(self, question):
+        """One question's rows across documents, numeric values first and largest first"""
+        rows = self.where(questions=[question])
+
+        def key(i):
+            value = rows["value"][i]
+            return (math.isnan(value), 0.0 if math.isnan(value) else -value, -rows["score"][i])
+
+        return rows.take(sorted(range(len(rows)), key=key))
+
+    def summary(self):
+        """Per-question aggregates: answered documents and the spread of numeric values"""
+        result = []
+        values, scores, documents = self.columns["value"], self.columns["score"], self.columns["document"]
+        for question, indices in self._groups("question").items():
+            answered = [i for i in indices if self.columns["answer"][i]]
+            numeric = [i for i in indices if not math.isnan(values[i])]
+            units = [self.columns["unit"][i] for i in numeric if self.columns["unit"][i]]
+            entry = {
+                "question": question,
+                "documents": len(indices),
+                "answered": len(answered),
+                "numeric": len(numeric),
+                "unit": max(set(units), key=units.count) if units else "",
+                "mean_score": round(sum(scores[i] for i in answered) / len(answered), 4) if answered else None,
+                "min": None, "max": None, "mean": None, "max_document": None,
+            }
+            if numeric:
+                top = max(numeric, key=values.__getitem__)
+                entry.update(min=min(values[i] for i in numeric), max=values[top],
+                             mean=sum(values[i] for i in numeric) / len(numeric),
+                             max_document=documents[top])
+            result.append(entry)
+        return result
+
+    # Export
+    def _export_columns(self):
+        columns = {name: self.columns[name] for name in EXPORTED[:-1]}
+        columns["value"] = [None if math.isnan(v) else v for v in self.columns["value"]]
+        columns["score"] = list(self.columns["score"])
+        columns["sources"] = ["; ".join(c["title"] for c in cites) for cites in self.columns["citations"]]
+        return columns
+
+    def to_records(self):
+        """JSON-ready rows; citations are kept without their chunk text"""
+        records = []
+        for row in self.rows():
+            row["value"] = None if math.isnan(row["value"]) else row["value"]
+            row["citations"] = [{k: v for k, v in c.items() if k != "text"} for c in row["citations"]]
+            records.append(row)
+        return records
+
+    def to_csv(self, file):
+        """Write the table as CSV, citations flattened to 'doc (p. N)' titles"""
+        columns = self._export_columns()
+        writer = csv.writer(file)
+        writer.writerow(EXPORTED)
+        writer.writerows(zip(*columns.values()))
+
+    def to_pandas(self):
+        """The table as a pandas DataFrame (requires pandas)"""
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("AnswerTable.to_pandas() requires pandas") from e
+        frame = pd.DataFrame(self._export_columns())
+        frame["value"] = frame["value"].astype("float64")
+        return frame
+
+    def to_arrow(self):
+        """The table as a pyarrow Table, citations included as a list column (requires pyarrow)"""
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("AnswerTable.to_arrow() requires pyarrow") from e
+        columns = self._export_columns()
+        columns["citations"] = [[{k: v for k, v in c.items() if k != "text"} for c in cites]
+                                for cites in self.columns["citations"]]
+        return pa.table(columns)
+
+
+# Running a question set
+def _document_owners(corpus, documents):
+    """indexed chunk id -> [(requested document name, that document's own chunk id)]
+
+    A chunk marked duplicate_of an indexed chunk makes its document an
+    owner of the indexed one, so hits on it count for both documents.
+    """
+    owners = {}
+    for name in documents:
+        resolved = corpus.resolve(name)
+        if resolved not in corpus.documents:
+            raise KeyError(name)
+        own = {}
+        for chunk_id in corpus.documents[resolved]["chunks"]:
+            own.setdefault(corpus.chunks[chunk_id].get("duplicate_of", chunk_id), chunk_id)
+        for indexed, chunk_id in own.items():
+            owners.setdefault(indexed, []).append((name, chunk_id))
+    return owners
+
+def _per_document(scored, owners, limit):
+    """Split one corpus-wide [(chunk id, score)] list into each document's top `limit`"""
+    by_document = {}
+    for chunk_id, score in scored:
+        for name, own_id in owners.get(chunk_id, ()):
+            by_document.setdefault(name, []).append((own_id, score))
+    return {name: heapq.nlargest(limit, hits, key=lambda hit: hit[1])
+            for name, hits in by_document.items()}
+
+def answer_question(corpus, question, owners, k=3, candidates=CANDIDATES,
+                    sentences=ANSWER_SENTENCES):
+    """Answer one question for every document in `owners`: {name: (answer, hits)}"""
+    lexical = _per_document(corpus.search(question, None), owners, candidates)
+    q = embed(question)
+    dense_scores = []
+    for chunk_id in owners:
+        vector = corpus.vectors[chunk_id]
+        if vector is not None:
+            dense_scores.append((chunk_id, sum(map(mul, q, vector))))
+    dense = _per_document(dense_scores, owners, candidates)
+
+    terms = list(dict.fromkeys(tokenize(question)))
+    query_terms, query_bigrams = set(terms), set(zip(terms, terms[1:]))
+    results = {}
+    for name in set(lexical) | set(dense):
+        # Dense similarity alone is no evidence; a document needs a lexical match to answer
+        if name not in lexical:
+            continue
+        fused = reciprocal_rank_fusion([lexical[name], dense.get(name, [])], RRF_K)
+        head = [(chunk_id, rerank_score(query_terms, query_bigrams, corpus.chunks[chunk_id]["text"]))
+                for chunk_id, _ in fused[:RERANK_TOP]]
+        head.sort(key=lambda hit: hit[1], reverse=True)
+        hits = head[:k]
+        results[name] = (answer_from_hits(corpus, question, hits, sentences), hits)
+    return results
+
+def run_batch(corpus, questions, documents=None, k=3, sentences=ANSWER_SENTENCES):
+    """Answer every question against every document; returns an AnswerTable
+
+    documents defaults to every document in the corpus, including names
+    that were recorded as near-duplicates of another document.
+    """
+    start = time.perf_counter()
+    corpus = corpus.snapshot()   # every answer comes from the same version of the corpus
+    questions = list(dict.fromkeys(q.strip() for q in questions if q.strip()))
+    if documents is None:
+        documents = list(corpus.documents) + list(corpus.duplicates)
+    documents = list(dict.fromkeys(documents))
+    owners = _document_owners(corpus, documents)
+
+    answers = [answer_question(corpus, question, owners, k, sentences=sentences) for question in questions]
+
+    table = AnswerTable()
+    for name in documents:
+        for question, per_document in zip(questions, answers):
+            answer, hits = per_document.get(name, ("", []))
+            citations = corpus.citations(hits)
+            value, unit = extract_value(answer)
+            table.append(
+                document=name, question=question, answer=answer, value=value, unit=unit,
+                score=hits[0][1] if hits else 0.0,
+                pages=", ".join(str(p) for p in dict.fromkeys(c["page"] for c in citations)),
+                citations=citations)
+    table.elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+    return table
+
+
+def main():
+    from simplify_workspaces import WorkspaceManager
+
+    parser = argparse.ArgumentParser(description="Run a question set against every document in a workspace")
+    parser.add_argument("--root", default="workspaces", help="workspaces directory")
+    parser.add_argument("--workspace", default="default")
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("-q", "--question", action="append", default=[], help="a question (repeatable)")
+    parser.add_argument("--document", action="append", help="limit to this document (repeatable)")
+    parser.add_argument("--k", type=int, default=3, help="citations per answer")
+    parser.add_argument("--csv", help="write the answers to this CSV file")
+    parser.add_argument("--json", help="write the answers and per-question summary to this JSON file")
+    args = parser.parse_args()
+
+    questions = list(args.question)
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions.extend(line for line in f if line.strip())
+    if not questions:
+        parser.error("give at least one question with -q or --questions")
+
+    corpus = WorkspaceManager(args.root).corpus(args.workspace)
+    table = run_batch(corpus, questions, args.document, k=args.k)
+    print(f"{len(table.documents)} documents x {len(table.questions)} questions "
+          f"-> {len(table)} answers in {table.elapsed_ms:.0f} ms")
+    for entry in table.summary():
+        line = f"  {entry['answered']:>4}/{entry['documents']:<4} {entry['question']}"
+        if entry["numeric"]:
+            line += f"  [max {entry['max']:g} {entry['unit']} in {entry['max_document']}]"
+        print(line)
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            table.to_csv(f)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": table.to_records(), "summary": table.summary()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
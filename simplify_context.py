@@ -0,0 +1,152 @@
+"""Bounded conversation context for chat follow-ups.
+
+The chat keeps every message for display, but what a turn actually uses
+is bounded: the last few turns verbatim plus a running extractive summary
+of everything older. When a turn falls out of the verbatim window its
+sentences are folded into the summary, and only the summary's own
+sentences are re-scored, so the cost of a turn does not depend on how
+long the conversation is. A follow-up question is expanded with key terms
+from the recent user turns and the summary's heaviest terms, so the topic
+of older turns still steers retrieval; a question that stands on its own
+is searched as asked, so a change of topic is not pulled back.
+
+Retrieval results are cached by (workspace, query, corpus version), so
+re-asking a question does not run retrieval again.
+
+Benchmark: python simplify_context.py --turns 500
+"""
+import argparse
+import time
+from collections import Counter, OrderedDict, deque
+from simplify_corpus import split_sentences, tokenize
+
+RECENT_TURNS = 6
+SUMMARY_SENTENCES = 8
+FOLLOW_UP_TERMS = 6
+FOLLOW_UP_MAX_TERMS = 3   # longer questions only count as follow-ups if they share a term
+SUMMARY_TERMS = 2
+CACHE_SIZE = 256
+
+
+class ConversationContext:
+    """Recent turns verbatim, older turns folded into a running summary"""
+
+    def __init__(self, recent_turns=RECENT_TURNS, summary_sentences=SUMMARY_SENTENCES,
+                 cache_size=CACHE_SIZE):
+        self.recent = deque()
+        self.recent_turns = recent_turns
+        self.summary_sentences = summary_sentences
+        self.summary = []            # [(order, sentence)] kept in conversation order
+        self.term_weights = Counter()
+        self.folded = 0
+        self.turns = 0
+        self.cache_size = cache_size
+        self._retrieval_cache = OrderedDict()
+
+    @classmethod
+    def from_messages(cls, messages, **kwargs):
+        """Rebuild the context for an existing message list (e.g. a reopened chat)"""
+        context = cls(**kwargs)
+        for message in messages:
+            context.add_turn(message["type"], message["text"])
+        return context
+
+    def add_turn(self, role, text):
+        """Record a turn; returns its turn number"""
+        self.turns += 1
+        self.recent.append((self.turns, role, text))
+        while len(self.recent) > self.recent_turns:
+            self._fold(*self.recent.popleft())
+        return self.turns
+
+    def _fold(self, turn, role, text):
+        sentences = [s for s in split_sentences(text) if tokenize(s)]
+        # Decay old weights so the summary follows the conversation's drift
+        if self.folded % 32 == 31:
+            self.term_weights = Counter({t: w // 2 for t, w in self.term_weights.items() if w > 1})
+        self.term_weights.update(tokenize(text))
+        self.folded += 1
+        candidates = self.summary + [((turn, i), f"{'User' if role == 'user' else 'AI'}: {s}")
+                                     for i, s in enumerate(sentences)]
+
+        def score(sentence):
+            tokens = tokenize(sentence)
+            return sum(self.term_weights[t] for t in tokens) / (len(tokens) or 1)
+
+        keep = sorted(candidates, key=lambda item: score(item[1]), reverse=True)[:self.summary_sentences]
+        self.summary = sorted(keep)
+
+    def follow_up_query(self, query):
+        """Expand a follow-up question with key terms from the recent user turns and the summary
+
+        A question is taken as a follow-up if it is too short to stand on
+        its own or shares a term with the recent user turns; anything else
+        is returned unchanged.
+        """
+        query_terms = set(tokenize(query))
+        turns = list(self.recent)
+        if turns and turns[-1][1:] == ("user", query):
+            turns.pop()   # the question itself, already recorded
+        recent_terms = Counter()
+        for _, role, text in turns:
+            if role == "user":
+                recent_terms.update(tokenize(text))
+        if len(query_terms) > FOLLOW_UP_MAX_TERMS and query_terms.isdisjoint(recent_terms):
+            return query
+        extra = [term for term, _ in recent_terms.most_common() if term not in query_terms][:FOLLOW_UP_TERMS]
+        seen = query_terms.union(extra)
+        older = {t for _, sentence in self.summary for t in tokenize(sentence.partition(": ")[2])
+                 if t not in seen}
+        extra += sorted(older, key=lambda t: (-self.term_weights[t], t))[:SUMMARY_TERMS]
+        return " ".join([query] + extra) if extra else query
+
+    def retrieve(self, key, run):
+        """Return cached results for key, calling run() on a miss"""
+        if key in self._retrieval_cache:
+            self._retrieval_cache.move_to_end(key)
+            return self._retrieval_cache[key]
+        result = run()
+        self._retrieval_cache[key] = result
+        if len(self._retrieval_cache) > self.cache_size:
+            self._retrieval_cache.popitem(last=False)
+        return result
+
+
+# Benchmark
+def main():
+    from simplify_corpus import Corpus
+    from simplify_retrieval import planner_for
+
+    parser = argparse.ArgumentParser(description="Per-turn latency of the context manager as a chat grows")
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    corpus = Corpus()
+    topics = ["DNA methylation in spaceflight", "epigenomic regulators Tet2 and Dnmt3a",
+              "immune response during deep space exposure", "magnesium sulfate concentration on Mars"]
+    for i, topic in enumerate(topics):
+        corpus.add_document(f"paper{i}.txt", f"This study examines {topic}. Results show effects of {topic} "
+                                             f"measured across {i + 3} cohorts. " * 40)
+    planner = planner_for(corpus)
+    context = ConversationContext()
+
+    timings = []
+    for turn in range(args.turns):
+        question = f"What did the paper find about {topics[turn % len(topics)]} in cohort {turn}?"
+        start = time.perf_counter()
+        context.add_turn("user", question)
+        query = context.follow_up_query(question)
+        result = context.retrieve(("bench", query, corpus.version), lambda: planner.retrieve(query, k=3))
+        context.add_turn("ai", result.corpus.chunks[result.hits[0][0]]["text"][:400])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    bucket = max(1, args.turns // 10)
+    print(f"{'turns':>11}  {'mean ms':>8}  {'max ms':>8}")
+    for start in range(0, args.turns, bucket):
+        chunk = timings[start:start + bucket]
+        print(f"{start + 1:>5}-{start + len(chunk):<5}  {sum(chunk) / len(chunk):8.3f}  {max(chunk):8.3f}")
+    print(f"summary: {len(context.summary)} sentences, recent: {len(context.recent)} turns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,709 @@
+import os
+import re
+import threading
+import zlib
+from array import array
+from collections import Counter, defaultdict
+import numpy as np
+from PyPDF2 import PdfReader
+import docx
+from simplify_dedup import Deduplicator, combine
+
+# Chunking settings - roughly a paragraph of text per chunk
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+
+# Dense vectors - hashed word and character-trigram features, so related word
+# forms ("epigenomic", "epigenetic") land close together without a model
+VECTOR_DIM = 64
+TRIGRAM_WEIGHT = 0.5
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were which with what how when who why does did do not can
+""".split())
+
+# File processing functions
+def extract_pages_from_pdf(file_path):
+    """Extract text from PDF file, one entry per page"""
+    with open(file_path, 'rb') as file:
+        reader = PdfReader(file)
+        return [(i + 1, page.extract_text() or "") for i, page in enumerate(reader.pages)]
+
+def extract_pages_from_txt(file_path):
+    """Extract text from TXT file as a single page"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return [(1, file.read())]
+
+def extract_pages_from_docx(file_path):
+    """Extract text from DOCX file as a single page"""
+    doc = docx.Document(file_path)
+    return [(1, "\n".join(paragraph.text for paragraph in doc.paragraphs))]
+
+def extract_pages(file_path, name=None):
+    """Extract (page, text) pairs based on file type; ValueError if the file cannot be read"""
+    name = name or os.path.basename(file_path)
+    if name.lower().endswith('.pdf'):
+        kind, extract = "PDF", extract_pages_from_pdf
+    elif name.lower().endswith('.txt'):
+        kind, extract = "text file", extract_pages_from_txt
+    elif name.lower().endswith('.docx'):
+        kind, extract = "DOCX", extract_pages_from_docx
+    else:
+        raise ValueError(f"Unsupported file format: {name}")
+    try:
+        return extract(file_path)
+    except FileNotFoundError:
+        raise
+    except Exception as e:
+        # Parsers fail in many ways on corrupt files; report them all the same way
+        raise ValueError(f"Error reading {kind} {name}: {e}") from e
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def split_sentences(text):
+    """Split text into sentences"""
+    return [s.strip() for s in SENTENCE_RE.split(text) if s.strip()]
+
+def chunk_pages(pages, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split (page, text) pairs into overlapping word windows"""
+    step = max(1, size - overlap)
+    for page, text in pages:
+        words = text.split()
+        for start in range(0, max(len(words), 1), step):
+            window = words[start:start + size]
+            if window:
+                yield page, " ".join(window)
+            if start + size >= len(words):
+                break
+
+def embed(text, dim=VECTOR_DIM):
+    """L2-normalized hashed feature vector of a text"""
+    vector = [0.0] * dim
+    for token in tokenize(text):
+        features = [(token, 1.0)]
+        padded = f"#{token}#"
+        features.extend((padded[i:i + 3], TRIGRAM_WEIGHT) for i in range(len(padded) - 2))
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % dim] += weight if (h >> 16) & 1 else -weight
+    norm = sum(x * x for x in vector) ** 0.5
+    return array("f", [x / norm for x in vector] if norm else vector)
+
+def estimate_chunk_bytes(text, term_counts):
+    """Approximate memory held by one chunk: its text, signature, vector and postings entries"""
+    return 700 + len(text) + 100 * len(term_counts)
+
+
+class _Layer:
+    """Read-only sequence: a base sequence with some items replaced, plus appended items.
+
+    Writers change a copy() and publish it; a published layer is never
+    changed again.
+    """
+
+    __slots__ = ("base", "size", "replaced", "tail")
+
+    def __init__(self, base=(), replaced=None, tail=None):
+        self.base = base
+        self.size = len(base)
+        self.replaced = replaced if replaced is not None else {}
+        self.tail = tail if tail is not None else []
+
+    def __len__(self):
+        return self.size + len(self.tail)
+
+    def __getitem__(self, i):
+        if i >= self.size:
+            return self.tail[i - self.size]
+        if i in self.replaced:
+            return self.replaced[i]
+        return self.base[i]
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self[i]
+        yield from self.tail
+
+    def __setitem__(self, i, value):
+        if i >= self.size:
+            self.tail[i - self.size] = value
+        else:
+            self.replaced[i] = value
+
+    def append(self, value):
+        self.tail.append(value)
+
+    def copy(self):
+        return _Layer(self.base, dict(self.replaced), list(self.tail))
+
+
+class _VectorLayer(_Layer):
+    """_Layer of chunk vectors that scores a query against many of them at once"""
+
+    __slots__ = ("_tail_matrix",)
+
+    def __init__(self, base=(), replaced=None, tail=None):
+        super().__init__(base, replaced, tail)
+        self._tail_matrix = None   # the tail stacked into one array, built on first use
+
+    def __setitem__(self, i, value):
+        super().__setitem__(i, value)
+        self._tail_matrix = None
+
+    def append(self, value):
+        super().append(value)
+        self._tail_matrix = None
+
+    def copy(self):
+        return _VectorLayer(self.base, dict(self.replaced), list(self.tail))
+
+    def scores(self, q, ids):
+        """Dot products of q with the vectors of ids (an int array), skipping None ones.
+
+        Returns (chunk ids, scores) arrays. The base answers for the ids it
+        holds that were not replaced.
+        """
+        found, scores = [], []
+        in_base = ids[ids < self.size]
+        if self.replaced and len(in_base):
+            replaced = np.isin(in_base, np.fromiter(self.replaced, np.int64, len(self.replaced)))
+            changed = [i for i in in_base[replaced].tolist() if self.replaced[i] is not None]
+            if changed:
+                found.append(np.array(changed, np.int64))
+                scores.append(_stack([self.replaced[i] for i in changed], len(q))[0] @ q)
+            in_base = in_base[~replaced]
+        if len(in_base):
+            base_ids, base_scores = self.base.scores(q, in_base)
+            found.append(base_ids)
+            scores.append(base_scores)
+        in_tail = ids[ids >= self.size] - self.size
+        if len(in_tail):
+            if self._tail_matrix is None:
+                self._tail_matrix = _stack(self.tail, len(q))
+            matrix, searchable = self._tail_matrix
+            in_tail = in_tail[searchable[in_tail]]
+            found.append(in_tail + self.size)
+            scores.append(matrix[in_tail] @ q)
+        if not found:
+            return np.zeros(0, np.int64), np.zeros(0, np.float32)
+        return np.concatenate(found), np.concatenate(scores)
+
+
+def _stack(vectors, dim):
+    """float32 matrix of embed() vectors with zero rows for None, and a mask of the real rows"""
+    zero = bytes(4 * dim)
+    data = b"".join(v.tobytes() if v is not None else zero for v in vectors)
+    matrix = np.frombuffer(data, np.float32).reshape(-1, dim)
+    return matrix, np.fromiter((v is not None for v in vectors), bool, len(vectors))
+
+
+def _id_array(ids):
+    if isinstance(ids, range):
+        return np.arange(ids.start, ids.stop, ids.step, dtype=np.int64)
+    return np.fromiter(ids, np.int64)
+
+
+class _Postings:
+    """term -> {chunk id: tf}: a base mapping minus removed chunks, plus in-memory postings.
+
+    Published postings dicts are never changed; a writer's copy() replaces
+    the dict of each term it touches with its own.
+    """
+
+    def __init__(self, base=None, removed=None, delta=None):
+        self.base = base
+        self.removed = removed if removed is not None else set()
+        self.delta = delta if delta is not None else {}
+        self._owned = set()   # terms whose delta dict this copy may change
+
+    def get(self, term, default=None):
+        extra = self.delta.get(term)
+        plist = self.base.get(term) if self.base is not None else None
+        if plist is None:
+            return default if extra is None else extra
+        # The base hands out a freshly decoded dict, so it can be trimmed in place
+        if self.removed:
+            for chunk_id in [c for c in self.removed if c in plist]:
+                del plist[chunk_id]
+        if extra:
+            plist.update(extra)
+        return plist or default
+
+    def __contains__(self, term):
+        return bool(self.get(term))
+
+    def __iter__(self):
+        """Terms with at least one posting"""
+        if self.base is not None:
+            for term in self.base:
+                if not self.removed or term in self.delta or self.get(term):
+                    yield term
+        for term in self.delta:
+            if self.base is None or term not in self.base:
+                yield term
+
+    def __getitem__(self, term):
+        plist = self.get(term)
+        if plist is None:
+            raise KeyError(term)
+        return plist
+
+    def copy(self):
+        return _Postings(self.base, set(self.removed), dict(self.delta))
+
+    def _own(self, term):
+        if term not in self._owned:
+            self.delta[term] = dict(self.delta.get(term, ()))
+            self._owned.add(term)
+        return self.delta[term]
+
+    def add(self, chunk_id, term_counts):
+        for term, n in term_counts.items():
+            self._own(term)[chunk_id] = n
+
+    def discard(self, chunk_id, terms):
+        for term in terms:
+            if chunk_id in self.delta.get(term, ()):
+                plist = self._own(term)
+                del plist[chunk_id]
+                if not plist:
+                    del self.delta[term]
+                    self._owned.discard(term)
+
+
+class CorpusSnapshot:
+    """One published version of a Corpus; read-only.
+
+    Holds the documents, chunks, postings and vectors as they were when it
+    was published, so a search, its citations and the answer text can all
+    be taken from the same snapshot while the corpus moves on.
+
+    With a base (a MappedIndex), chunk ids below len(base) are read from
+    the mapped file and only what changed since it was written is held in
+    memory.
+    """
+
+    def __init__(self, base=None):
+        self.documents = {}        # name -> {"path", "pages", "chunks": [chunk ids], "bytes"}
+        self.chunks = _Layer()     # chunk id -> {"doc", "page", "text"[, "duplicate_of"]}, None once removed
+        self.postings = _Postings()  # term -> {chunk id: term frequency}
+        self.chunk_lengths = _Layer()
+        self.vectors = _VectorLayer()  # chunk id -> embed() of its text, None when not searchable
+        self.live_chunks = 0
+        self.duplicates = {}       # skipped document name -> name of the document it duplicates
+        self.alias_paths = {}      # skipped document name -> its file, to index it from if it takes over
+        self.copies = {}           # indexed chunk id -> ids of the chunks marked duplicate_of it
+        self.memory_bytes = 0      # rough footprint of the whole index, kept up to date on ingest
+        self.resident_bytes = 0    # the part of it held in memory rather than read from the base file
+        self.version = 0           # bumped on every change, for caches keyed on corpus contents
+        if base is not None:
+            self.documents = dict(base.documents)
+            self.chunks = _Layer(base.chunks)
+            self.postings = _Postings(base.postings)
+            self.chunk_lengths = _Layer(base.chunk_lengths)
+            self.vectors = _VectorLayer(base.vectors)
+            self.live_chunks = base.live_chunks
+            self.duplicates = dict(base.duplicates)
+            self.alias_paths = dict(base.alias_paths)
+            self.copies = dict(base.copies)
+            self.memory_bytes = base.meta["memory_bytes"]
+            self.version = base.version
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def copy(self):
+        """A private copy for a writer to change and publish"""
+        draft = CorpusSnapshot()
+        draft.documents = dict(self.documents)
+        draft.chunks = self.chunks.copy()
+        draft.postings = self.postings.copy()
+        draft.chunk_lengths = self.chunk_lengths.copy()
+        draft.vectors = self.vectors.copy()
+        draft.live_chunks = self.live_chunks
+        draft.duplicates = dict(self.duplicates)
+        draft.alias_paths = dict(self.alias_paths)
+        draft.copies = dict(self.copies)
+        draft.memory_bytes = self.memory_bytes
+        draft.resident_bytes = self.resident_bytes
+        draft.version = self.version
+        return draft
+
+    def snapshot(self):
+        return self
+
+    def resolve(self, name):
+        """Name of the indexed document a (possibly duplicate) document name refers to"""
+        return self.duplicates.get(name, name)
+
+    def search(self, query, k=5, docs=None):
+        """Rank chunks against a query with TF-IDF; returns (chunk id, score) pairs"""
+        live = self.live_chunks or 1
+        scores = Counter()
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = 1.0 + (live / len(plist)) ** 0.5
+            for chunk_id, tf in plist.items():
+                scores[chunk_id] += tf * idf / (1 + self.chunk_lengths[chunk_id]) ** 0.5
+        if docs is not None:
+            docs = {self.resolve(name) for name in docs}
+            filtered = Counter()
+            for chunk_id, score in scores.items():
+                own = self._copy_in(chunk_id, docs)
+                if own is not None:
+                    filtered[own] = score
+            scores = filtered
+        return scores.most_common(k)
+
+    def dense_search(self, query, k=5, docs=None, ids=None, q=None):
+        """Rank chunks by cosine similarity of their vectors; returns (chunk id, score) pairs
+
+        ids, if given, limits the scan to those chunk ids. q, if given, is
+        embed(query), for callers that score one query in several calls.
+        """
+        q = np.asarray(embed(query) if q is None else q, dtype=np.float32)
+        ids = np.arange(len(self.vectors)) if ids is None else _id_array(ids)
+        chunk_ids, scores = self.vectors.scores(q, ids)
+        if docs is None:
+            top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            return [(int(chunk_ids[i]), float(scores[i])) for i in top[np.argsort(-scores[top])]]
+        docs = {self.resolve(name) for name in docs}
+        hits = []
+        for i in np.argsort(-scores):
+            own = self._copy_in(int(chunk_ids[i]), docs)
+            if own is not None:
+                hits.append((own, float(scores[i])))
+                if len(hits) == k:
+                    break
+        return hits
+
+    def _copy_in(self, chunk_id, docs):
+        """The chunk itself if it belongs to one of docs, else its duplicate that does, else None.
+
+        A passage shared by several documents is only indexed once, so a
+        document-filtered search has to credit the hit to the filtered
+        document's own copy.
+        """
+        chunk = self.chunks[chunk_id]
+        if chunk is None:
+            return None
+        if chunk["doc"] in docs:
+            return chunk_id
+        for copy in self.copies.get(chunk_id, ()):
+            if self.chunks[copy]["doc"] in docs:
+                return copy
+        return None
+
+    def citations(self, hits):
+        """Turn search hits into citation dicts like the ones the chat UI renders"""
+        result = []
+        for number, (chunk_id, score) in enumerate(hits, start=1):
+            chunk = self.chunks[chunk_id]
+            result.append({
+                "id": chunk_id,
+                "number": number,
+                "title": f"{chunk['doc']} (p. {chunk['page']})",
+                "fileName": chunk["doc"],
+                "path": self.documents[chunk["doc"]]["path"],
+                "page": chunk["page"],
+                "score": round(score, 4),
+                "text": chunk["text"],
+            })
+        return result
+
+    def document_pages(self, name):
+        """Rebuild a document's (page, text) pairs from its chunks, dropping the overlaps"""
+        pages = []
+        for chunk_id in self.documents[self.resolve(name)]["chunks"]:
+            chunk = self.chunks[chunk_id]
+            if pages and pages[-1][0] == chunk["page"]:
+                pages[-1][1].append(" ".join(chunk["text"].split()[CHUNK_OVERLAP:]))
+            else:
+                pages.append((chunk["page"], [chunk["text"]]))
+        return [(page, " ".join(parts)) for page, parts in pages]
+
+    def document_text(self, name):
+        """Rebuild a document's text from its chunks, dropping the overlaps"""
+        return " ".join(text for _, text in self.document_pages(name))
+
+    def summarize(self, names=None, sentences=5):
+        """Extractive summary: the highest-weighted sentences in document order"""
+        names = dict.fromkeys(self.resolve(name) for name in names or list(self.documents))
+        text = " ".join(self.document_text(name) for name in names if name in self.documents)
+        candidates = split_sentences(text)
+        if not candidates:
+            return ""
+        freq = Counter(tokenize(text))
+        scored = []
+        for i, sentence in enumerate(candidates):
+            tokens = tokenize(sentence)
+            if tokens:
+                scored.append((sum(freq[t] for t in tokens) / len(tokens), i))
+        best = sorted(i for _, i in sorted(scored, reverse=True)[:sentences])
+        seen = set()
+        picked = []
+        for i in best:
+            if candidates[i] not in seen:
+                seen.add(candidates[i])
+                picked.append(candidates[i])
+        return " ".join(picked)
+
+
+class Corpus:
+    """In-process document store with an inverted index over chunks.
+
+    All reads go through an immutable CorpusSnapshot. A writer copies the
+    containers it changes into a new snapshot, under the writer lock, and
+    publishes it with a single reference swap; chunk dicts, postings dicts
+    and document entries that were published are replaced, never changed
+    in place. A reader therefore sees one version of the corpus for as
+    long as it holds a snapshot: take corpus.snapshot() once and get the
+    hits, citations and text for a request from it. Attribute reads and
+    query methods on the Corpus itself go to the current snapshot.
+
+    A corpus opened from an index file (simplify_index.load_corpus) keeps
+    the memory-mapped file as its base and holds only later changes in
+    memory, so opening costs the same however large the index is. The
+    dedup indexes are filled from the file's signatures on the first
+    write, since queries do not need them.
+
+    With dedup enabled, a document that nearly matches one already in the
+    corpus is recorded as an alias of it instead of being indexed again,
+    and a chunk that nearly matches an indexed chunk is kept (so its
+    document's text stays whole) but left out of the postings, so
+    searches return the passage once. When a document with aliases is
+    removed or replaced, its first alias is indexed in its place, from its
+    file if it still exists, else from the original's text.
+    """
+
+    def __init__(self, dedup=True, base=None):
+        self._state = CorpusSnapshot(base)
+        self.dedup = Deduplicator() if dedup else None
+        self._dedup_base = base if dedup else None   # base whose signatures are not loaded yet
+        self._lock = threading.Lock()   # serializes writers; readers never take it
+
+    def __getattr__(self, name):
+        # documents, chunks, search(), citations(), ... come from the current snapshot
+        if name.startswith("__") or name == "_state":
+            raise AttributeError(name)
+        return getattr(self._state, name)
+
+    def __len__(self):
+        return len(self._state)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """The current version of the corpus, unaffected by later writes"""
+        return self._state
+
+    def deduplicator(self):
+        """The dedup indexes, filled in from the base file if need be; None without dedup"""
+        with self._lock:
+            self._load_dedup()
+        return self.dedup
+
+    def _load_dedup(self):
+        base, self._dedup_base = self._dedup_base, None
+        if base is None:
+            return
+        for chunk_id, signature in base.chunk_signatures():
+            self.dedup.chunks.add(chunk_id, signature)
+        for name, signature in base.document_signatures():
+            self.dedup.documents.add(name, signature)
+
+    def rebase(self, index, remap=None):
+        """Continue on top of a freshly written index file of this corpus.
+
+        The in-memory delta is dropped in favour of the file. remap maps
+        chunk ids to their ids in the (compacted) file, None when they are
+        unchanged. Returns False, leaving the corpus as it was, if the
+        corpus changed after the file was written.
+        """
+        with self._lock:
+            if index.version != self._state.version:
+                return False
+            if self._dedup_base is not None:
+                self._dedup_base = index
+            elif self.dedup is not None and remap is not None:
+                self.dedup.chunks = self.dedup.chunks.rekeyed(remap)
+            self._state = CorpusSnapshot(index)
+            return True
+
+    def add_file(self, file_path, name=None):
+        """Parse a file from disk and add it to the corpus"""
+        name = name or os.path.basename(file_path)
+        return self.add_document(name, extract_pages(file_path, name), path=file_path)
+
+    def add_document(self, name, pages, path=None, admit=None):
+        """Add a document given as text or (page, text) pairs; returns its chunk ids
+
+        admit, if given, is called with what memory_bytes would become as
+        the document is chunked, so an oversized document is refused before
+        it is fully indexed, and again just before it is published; raising
+        from it leaves the corpus unchanged.
+        """
+        if isinstance(pages, str):
+            pages = [(1, pages)]
+        pages = list(pages)
+        before = self._projected_bytes(self._state, name, 0)
+        prepared = self._prepare(name, pages, admit, before)
+
+        with self._lock:
+            if admit is not None:
+                admit(self._projected_bytes(self._state, name, prepared[2]))
+            if prepared[3]:
+                self._load_dedup()
+            draft = self._state.copy()
+            draft.version += 1
+            draft.duplicates.pop(name, None)
+            draft.alias_paths.pop(name, None)
+            self._drop(draft, name)
+            ids = self._insert(draft, name, len(pages), path, prepared)
+            self._state = draft
+        return ids
+
+    def _prepare(self, name, pages, admit=None, before=0):
+        """Chunk, count, sign and embed a document outside the writer lock"""
+        new_chunks, counts, footprint = [], [], 0
+        for page, text in chunk_pages(pages):
+            tf = Counter(tokenize(text))
+            new_chunks.append({"doc": name, "page": page, "text": text})
+            counts.append(tf)
+            footprint += estimate_chunk_bytes(text, tf)
+            if admit is not None:
+                admit(before + footprint)
+        signatures = self.dedup.signatures(c["text"] for c in new_chunks) if self.dedup else None
+        vectors = [embed(chunk["text"]) for chunk in new_chunks]
+        return new_chunks, counts, footprint, signatures, vectors
+
+    def _insert(self, draft, name, page_count, path, prepared):
+        new_chunks, counts, footprint, signatures, vectors = prepared
+        if signatures:
+            doc_signature = combine(signatures)
+            match = self.dedup.documents.query(doc_signature)
+            if match is not None:
+                draft.duplicates[name] = match[0]
+                if path is not None:
+                    draft.alias_paths[name] = path
+                return []
+        base = len(draft.chunks)
+        ids = list(range(base, base + len(new_chunks)))
+        for i, (chunk_id, chunk, tf) in enumerate(zip(ids, new_chunks, counts)):
+            draft.chunks.append(chunk)
+            if signatures:
+                match = self.dedup.chunks.query(signatures[i])
+                if match is not None:
+                    chunk["duplicate_of"] = match[0]
+                    draft.copies[match[0]] = draft.copies.get(match[0], ()) + (chunk_id,)
+                    draft.chunk_lengths.append(0)
+                    draft.vectors.append(None)
+                    continue
+                self.dedup.chunks.add(chunk_id, signatures[i])
+            draft.chunk_lengths.append(sum(tf.values()))
+            draft.vectors.append(vectors[i])
+            draft.postings.add(chunk_id, tf)
+        if signatures:
+            self.dedup.documents.add(name, doc_signature)
+        draft.documents[name] = {"path": path, "pages": page_count, "chunks": ids,
+                                 "bytes": footprint}
+        draft.memory_bytes += footprint
+        draft.resident_bytes += footprint
+        draft.live_chunks += len(ids)
+        return ids
+
+    @staticmethod
+    def _projected_bytes(state, name, footprint):
+        replaced = state.documents.get(name)
+        return state.memory_bytes - (replaced.get("bytes", 0) if replaced else 0) + footprint
+
+    def remove_document(self, name):
+        """Drop a document, or an alias of one, from the corpus"""
+        with self._lock:
+            if name not in self._state.documents and name not in self._state.duplicates:
+                return
+            self._load_dedup()
+            draft = self._state.copy()
+            draft.version += 1
+            draft.duplicates.pop(name, None)
+            draft.alias_paths.pop(name, None)
+            self._drop(draft, name)
+            self._state = draft
+
+    def _drop(self, draft, name):
+        """Remove an indexed document; its first alias is indexed in its place"""
+        if name not in draft.documents:
+            return
+        aliases = [alias for alias, orig in draft.duplicates.items() if orig == name]
+        pages = draft.document_pages(name) if aliases else None
+        self._remove(draft, name)
+        if not aliases:
+            return
+        heir, rest = aliases[0], aliases[1:]
+        del draft.duplicates[heir]
+        path = draft.alias_paths.pop(heir, None)
+        if path is not None:
+            try:
+                pages = extract_pages(path, heir)
+            except (OSError, ValueError):
+                pass   # the file is gone; the near-identical text of the original will do
+        self._insert(draft, heir, len(pages), path, self._prepare(heir, pages))
+        for alias in rest:
+            draft.duplicates[alias] = draft.resolve(heir)
+
+    def _remove(self, draft, name):
+        doc = draft.documents.pop(name)
+        draft.memory_bytes -= doc.get("bytes", 0)
+        if doc["chunks"] and doc["chunks"][0] >= draft.chunks.size:
+            draft.resident_bytes -= doc.get("bytes", 0)
+        dead = set(doc["chunks"])
+        draft.live_chunks -= len(dead)
+        for chunk_id in dead:
+            chunk = draft.chunks[chunk_id]
+            draft.chunks[chunk_id] = None
+            draft.chunk_lengths[chunk_id] = 0
+            draft.vectors[chunk_id] = None
+            if chunk_id < draft.chunks.size:
+                draft.postings.removed.add(chunk_id)
+            draft.postings.discard(chunk_id, set(tokenize(chunk["text"])))
+        if self.dedup is not None:
+            self.dedup.documents.remove(name)
+            for chunk_id in dead:
+                self.dedup.chunks.remove(chunk_id)
+        # Copies in this document stop counting; when an indexed chunk goes, its
+        # first remaining copy takes over as the indexed one
+        for kept in [k for k, ids in draft.copies.items() if k in dead or dead.intersection(ids)]:
+            survivors = [c for c in draft.copies.pop(kept) if c not in dead]
+            if not survivors:
+                continue
+            if kept not in dead:
+                draft.copies[kept] = tuple(survivors)
+                continue
+            promoted, rest = survivors[0], survivors[1:]
+            chunk = {key: value for key, value in draft.chunks[promoted].items() if key != "duplicate_of"}
+            draft.chunks[promoted] = chunk
+            tf = Counter(tokenize(chunk["text"]))
+            draft.chunk_lengths[promoted] = sum(tf.values())
+            draft.vectors[promoted] = embed(chunk["text"])
+            draft.postings.add(promoted, tf)
+            if self.dedup is not None:
+                self.dedup.chunks.add(promoted, self.dedup.signatures([chunk["text"]])[0])
+            for copy in rest:
+                draft.chunks[copy] = dict(draft.chunks[copy], duplicate_of=promoted)
+            if rest:
+                draft.copies[promoted] = tuple(rest)
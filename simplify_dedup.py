@@ -0,0 +1,119 @@
+"""Near-duplicate detection for ingestion.
+
+MinHash signatures estimate the Jaccard similarity of two texts' word
+shingles, and a banded LSH index finds candidate matches by bucket lookup
+instead of comparing against every stored signature, so checking a new
+chunk costs the same however large the corpus is.
+
+Hashes are crc32-based rather than Python's hash() so signatures stay
+valid across processes and can be pickled with the index.
+"""
+import zlib
+from array import array
+from collections import defaultdict
+
+SHINGLE_WORDS = 5
+NUM_PERM = 32
+BANDS = 8                      # 8 bands x 4 rows: candidates from ~0.6 similarity up
+DOCUMENT_THRESHOLD = 0.9       # a re-upload of the same paper
+CHUNK_THRESHOLD = 0.8          # a passage repeated across versions, allowing for a few shifted words
+
+_PRIME = (1 << 31) - 1
+_PERMUTATIONS = [((1103515245 * (i + 1) + 12345) % _PRIME or 1,
+                  (2654435761 * (i + 7)) % _PRIME) for i in range(NUM_PERM)]
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """Stable 32-bit hashes of the lowercased word n-grams in a text"""
+    words = text.lower().split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+            for i in range(len(words) - size + 1)}
+
+
+def minhash(hashes):
+    """MinHash signature of a set of shingle hashes"""
+    return array("I", [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS])
+
+
+def combine(signatures):
+    """Signature of the union of several shingle sets, e.g. a document from its chunks"""
+    signatures = list(signatures)
+    if not signatures:
+        return None
+    return array("I", map(min, zip(*signatures)))
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class LSHIndex:
+    """Banded locality-sensitive hash index over MinHash signatures"""
+
+    def __init__(self, threshold, bands=BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.signatures = {}
+        self.buckets = defaultdict(list)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for bucket in self._keys(signature):
+            self.buckets[bucket].append(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket in self._keys(signature):
+            keys = self.buckets.get(bucket)
+            if keys is not None:
+                if key in keys:
+                    keys.remove(key)
+                if not keys:
+                    del self.buckets[bucket]
+
+    def rekeyed(self, mapping):
+        """A copy with each key replaced by mapping[key]; keys missing from mapping are dropped"""
+        index = LSHIndex(self.threshold, self.bands)
+        for key, signature in self.signatures.items():
+            if key in mapping:
+                index.add(mapping[key], signature)
+        return index
+
+    def query(self, signature):
+        """Best stored match at or above the threshold as (key, similarity), or None"""
+        seen = set()
+        best = None
+        for bucket in self._keys(signature):
+            for key in self.buckets.get(bucket, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = similarity(signature, self.signatures[key])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        return best
+
+
+class Deduplicator:
+    """Document- and chunk-level near-duplicate indexes for one corpus"""
+
+    def __init__(self, document_threshold=DOCUMENT_THRESHOLD, chunk_threshold=CHUNK_THRESHOLD):
+        self.documents = LSHIndex(document_threshold)
+        self.chunks = LSHIndex(chunk_threshold)
+
+    def signatures(self, texts):
+        """MinHash signatures for a list of chunk texts"""
+        return [minhash(shingles(text)) for text in texts]
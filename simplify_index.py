@@ -0,0 +1,563 @@
+"""On-disk index format for Simplify.
+
+A single versioned file holds everything needed to answer queries without
+re-ingesting: a JSON metadata block, a sorted term table, varint-encoded
+postings (chunk ids delta-encoded), a fixed-width chunk metadata table
+with its text blob, float16 chunk vectors and the dedup signatures.
+
+    header   "SIMPLIFY" | version u16 | section count u16 | reserved u32
+    table    per section: tag (4 bytes) | offset u64 | length u64
+    META     JSON: documents (as contiguous chunk ranges), duplicates and their files, chunk copies,
+             counts, vector dim
+    TIDX     per term, sorted: term offset u64 | postings offset u64 | term length u16 | df u32 | postings length u32
+    TSTR     UTF-8 term strings
+    POST     per term: varint(chunk id delta), varint(term frequency), ...
+    CHNK     per chunk: doc u32 | page u32 | length u32 | text offset u64 | text length u32 | duplicate_of i64
+    TEXT     UTF-8 chunk texts
+    VECS     chunk count x dim float16, little endian
+    SIGS     chunk count x NUM_PERM u32 MinHash rows (zeros for unsigned chunks)
+    DSIG     document count x NUM_PERM u32
+
+open_index() maps the file and only parses the header and metadata; term
+lookups binary-search TIDX in place and postings, chunks and vectors are
+decoded on access, so opening cost does not grow with the chunk count.
+load_corpus() opens a mutable Corpus on top of the mapped file: queries
+read the file and documents added or removed afterwards are held in
+memory until the corpus is written out again.
+
+Benchmark: python simplify_index.py --chunks 1000000
+Tests: python -m pytest test_simplify_index.py
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+import numpy as np
+from simplify_corpus import VECTOR_DIM, Corpus, CorpusSnapshot, embed
+from simplify_dedup import NUM_PERM
+
+MAGIC = b"SIMPLIFY"
+VERSION = 1
+
+HEADER = struct.Struct("<8sHHI")
+SECTION = struct.Struct("<4sQQ")
+TERM_ROW = struct.Struct("<QQHII")
+CHUNK_ROW = struct.Struct("<IIIQIq")
+SCORE_BLOCK = 65536   # vector rows converted to float32 at a time when scoring
+SECTIONS = (b"META", b"TIDX", b"TSTR", b"POST", b"CHNK", b"TEXT", b"VECS", b"SIGS", b"DSIG")
+
+
+class IndexFormatError(Exception):
+    """Raised when a file is not a Simplify index or has an unsupported version"""
+
+
+# Varint coding
+def encode_varints(values, out):
+    """Append unsigned LEB128 varints to a bytearray"""
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+
+def decode_varints(data):
+    """Decode a buffer of unsigned LEB128 varints"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+def encode_postings(postings):
+    """Encode {chunk id: tf} as delta-coded (id, tf) varint pairs"""
+    out = bytearray()
+    previous = 0
+    pairs = []
+    for chunk_id in sorted(postings):
+        pairs.append(chunk_id - previous)
+        pairs.append(postings[chunk_id])
+        previous = chunk_id
+    encode_varints(pairs, out)
+    return out
+
+def decode_postings(data):
+    """Inverse of encode_postings"""
+    values = decode_varints(data)
+    result = {}
+    chunk_id = 0
+    for i in range(0, len(values), 2):
+        chunk_id += values[i]
+        result[chunk_id] = values[i + 1]
+    return result
+
+
+# Writing
+def write_sections(path, meta, terms, chunk_rows, texts, vectors=None, dim=0,
+                   signatures=None, doc_signatures=None):
+    """Write an index file from prepared parts.
+
+    terms yields (term, {chunk id: tf}) in sorted term order; chunk_rows
+    yields (doc index, page, length, duplicate_of) aligned with texts;
+    vectors and signatures, when given, are flat sequences per chunk.
+    The file is written next to `path` and renamed into place.
+    """
+    meta = dict(meta, version=VERSION, dim=dim, num_perm=NUM_PERM)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".simplify-index-", dir=directory)
+    offsets = {}
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * (HEADER.size + SECTION.size * len(SECTIONS)))
+
+            def section(tag, writer):
+                start = f.tell()
+                writer()
+                offsets[tag] = (start, f.tell() - start)
+
+            # Postings first: the term table needs their offsets
+            term_rows = bytearray()
+            term_strings = bytearray()
+            post_start = f.tell()
+
+            def write_postings():
+                for term, plist in terms:
+                    encoded = term.encode("utf-8")
+                    data = encode_postings(plist)
+                    term_rows.extend(TERM_ROW.pack(len(term_strings), f.tell() - post_start,
+                                                   len(encoded), len(plist), len(data)))
+                    term_strings.extend(encoded)
+                    f.write(data)
+            section(b"POST", write_postings)
+            meta["terms"] = len(term_rows) // TERM_ROW.size
+            section(b"TIDX", lambda: f.write(term_rows))
+            section(b"TSTR", lambda: f.write(term_strings))
+
+            text_blob = bytearray()
+
+            def write_chunks():
+                count = 0
+                for (doc, page, length, duplicate_of), text in zip(chunk_rows, texts):
+                    encoded = text.encode("utf-8")
+                    f.write(CHUNK_ROW.pack(doc, page, length, len(text_blob), len(encoded), duplicate_of))
+                    text_blob.extend(encoded)
+                    count += 1
+                meta["chunks"] = count
+            section(b"CHNK", write_chunks)
+            section(b"TEXT", lambda: f.write(text_blob))
+            del text_blob[:]
+
+            def write_floats():
+                if vectors is not None and dim:
+                    for vector in vectors:
+                        f.write(struct.pack(f"<{dim}e", *vector))
+            section(b"VECS", write_floats)
+
+            def write_rows(rows):
+                def writer():
+                    for row in rows or ():
+                        f.write(array("I", row).tobytes())
+                return writer
+            section(b"SIGS", write_rows(signatures))
+            section(b"DSIG", write_rows(doc_signatures))
+
+            section(b"META", lambda: f.write(json.dumps(meta).encode("utf-8")))
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, len(SECTIONS), 0))
+            for tag in SECTIONS:
+                f.write(SECTION.pack(tag, *offsets[tag]))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_index(corpus, path):
+    """Save a Corpus, compacting away removed chunks.
+
+    Returns {old chunk id: new chunk id}, or None when no chunk moved.
+    """
+    dedup = corpus.deduplicator()
+    corpus = corpus.snapshot()
+    live = [i for i, chunk in enumerate(corpus.chunks) if chunk is not None]
+    remap = {old: new for new, old in enumerate(live)}
+    names = list(corpus.documents)
+    doc_index = {name: i for i, name in enumerate(names)}
+
+    documents = []
+    for name in names:
+        doc = corpus.documents[name]
+        ids = [remap[i] for i in doc["chunks"]]
+        documents.append([name, doc["path"], doc["pages"], ids[0] if ids else 0, len(ids),
+                          doc.get("bytes", 0)])
+    meta = {
+        "documents": documents,
+        "duplicates": corpus.duplicates,
+        "alias_paths": corpus.alias_paths,
+        "copies": [[remap[kept], [remap[i] for i in ids]] for kept, ids in corpus.copies.items()],
+        "dedup": dedup is not None,
+        "memory_bytes": corpus.memory_bytes,
+        "corpus_version": corpus.version,
+    }
+
+    def terms():
+        for term in sorted(corpus.postings):
+            yield term, {remap[i]: tf for i, tf in corpus.postings[term].items()}
+
+    def chunk_rows():
+        for old in live:
+            chunk = corpus.chunks[old]
+            duplicate_of = chunk.get("duplicate_of")
+            yield (doc_index[chunk["doc"]], chunk["page"], corpus.chunk_lengths[old],
+                   remap.get(duplicate_of, -1) if duplicate_of is not None else -1)
+
+    signatures = doc_signatures = None
+    if dedup is not None:
+        empty = array("I", [0]) * NUM_PERM
+        signatures = (dedup.chunks.signatures.get(old, empty) for old in live)
+        doc_signatures = (dedup.documents.signatures.get(name, empty) for name in names)
+
+    zeros = [0.0] * VECTOR_DIM
+    vectors = (corpus.vectors[i] or zeros for i in live)
+    write_sections(path, meta, terms(), chunk_rows(), (corpus.chunks[i]["text"] for i in live),
+                   vectors=vectors, dim=VECTOR_DIM,
+                   signatures=signatures, doc_signatures=doc_signatures)
+    return remap if len(live) < len(corpus.chunks) else None
+
+
+# Reading
+class _Postings:
+    """Read-only term -> {chunk id: tf} mapping over the mapped term table"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.meta["terms"]
+
+    def __contains__(self, term):
+        return self._index._find_term(term) is not None
+
+    def __iter__(self):
+        index = self._index
+        for i in range(len(self)):
+            yield index._term_at(i)
+
+    def __getitem__(self, term):
+        plist = self.get(term)
+        if plist is None:
+            raise KeyError(term)
+        return plist
+
+    def get(self, term, default=None):
+        row = self._index._find_term(term)
+        if row is None:
+            return default
+        _, post_offset, _, _, post_len = row
+        start = self._index._sections[b"POST"][0] + post_offset
+        return decode_postings(self._index._mm[start:start + post_len])
+
+
+class _ChunkTable:
+    """Read-only sequence of chunk dicts decoded from the chunk table"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.meta["chunks"]
+
+    def __getitem__(self, chunk_id):
+        index = self._index
+        if not 0 <= chunk_id < len(self):
+            raise IndexError(chunk_id)
+        doc, page, _, text_offset, text_len, duplicate_of = index._chunk_row(chunk_id)
+        start = index._sections[b"TEXT"][0] + text_offset
+        chunk = {"doc": index.doc_names[doc], "page": page,
+                 "text": index._mm[start:start + text_len].decode("utf-8")}
+        if duplicate_of >= 0:
+            chunk["duplicate_of"] = duplicate_of
+        return chunk
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _ChunkLengths:
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.meta["chunks"]
+
+    def __getitem__(self, chunk_id):
+        return self._index._chunk_row(chunk_id)[2]
+
+
+class _Vectors:
+    """Read-only sequence of chunk vectors; None for chunks left out of search.
+
+    Files written without vectors embed the chunk text on access.
+    """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.meta["chunks"]
+
+    def __getitem__(self, chunk_id):
+        if self._index._chunk_row(chunk_id)[5] >= 0:
+            return None
+        if not self._index.dim:
+            return embed(self._index.chunks[chunk_id]["text"])
+        return self._index.vector(chunk_id)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def scores(self, q, ids):
+        """Dot products of q with the vectors of ids (an int array), skipping duplicates.
+
+        Returns (chunk ids, scores) arrays, read straight from the mapped
+        float16 rows.
+        """
+        index = self._index
+        ids = ids[index.searchable()[ids]]
+        if not index.dim:
+            rows = [embed(index.chunks[i]["text"]) for i in ids.tolist()]
+            return ids, np.array(rows, np.float32).reshape(-1, len(q)) @ q
+        matrix = index.vector_matrix()
+        scores = np.empty(len(ids), np.float32)
+        for start in range(0, len(ids), SCORE_BLOCK):
+            block = ids[start:start + SCORE_BLOCK]
+            scores[start:start + len(block)] = matrix[block].astype(np.float32) @ q
+        return ids, scores
+
+
+class MappedIndex:
+    """A read-only, memory-mapped index answering the same queries as a Corpus"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise IndexFormatError(f"{path} is empty")
+        magic, version, count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise IndexFormatError(f"{path} is not a Simplify index")
+        if version != VERSION:
+            self.close()
+            raise IndexFormatError(f"{path} has index version {version}, expected {VERSION}")
+        self._sections = {}
+        for i in range(count):
+            tag, offset, length = SECTION.unpack_from(self._mm, HEADER.size + i * SECTION.size)
+            self._sections[tag] = (offset, length)
+        offset, length = self._sections[b"META"]
+        self.meta = json.loads(self._mm[offset:offset + length])
+
+        self.documents = {}
+        self.doc_names = []
+        for name, path_, pages, first, count, nbytes in self.meta["documents"]:
+            self.doc_names.append(name)
+            self.documents[name] = {"path": path_, "pages": pages,
+                                    "chunks": range(first, first + count), "bytes": nbytes}
+        self.duplicates = self.meta["duplicates"]
+        self.alias_paths = self.meta.get("alias_paths", {})
+        if "copies" in self.meta:
+            self.copies = {kept: tuple(ids) for kept, ids in self.meta["copies"]}
+        else:
+            # Written before copies were recorded: find them in the chunk table
+            self.copies = {}
+            for chunk_id in range(self.meta["chunks"]):
+                kept = self._chunk_row(chunk_id)[5]
+                if kept >= 0:
+                    self.copies[kept] = self.copies.get(kept, ()) + (chunk_id,)
+        self.dim = self.meta["dim"]
+        self.memory_bytes = 0
+        self.version = self.meta.get("corpus_version", 0)
+        self.chunks = _ChunkTable(self)
+        self.chunk_lengths = _ChunkLengths(self)
+        self.postings = _Postings(self)
+        self.vectors = _Vectors(self)
+        self.live_chunks = self.meta["chunks"]
+        self._vector_matrix = None
+        self._searchable = None
+
+    def __len__(self):
+        return self.meta["chunks"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._vector_matrix = None   # a view of the map; it would keep the map from closing
+        self._mm.close()
+        self._file.close()
+
+    # Read-only query methods shared with Corpus; the mapped file never changes,
+    # so it is its own snapshot
+    snapshot = CorpusSnapshot.snapshot
+    resolve = CorpusSnapshot.resolve
+    search = CorpusSnapshot.search
+    dense_search = CorpusSnapshot.dense_search
+    citations = CorpusSnapshot.citations
+    document_pages = CorpusSnapshot.document_pages
+    document_text = CorpusSnapshot.document_text
+    _copy_in = CorpusSnapshot._copy_in
+    summarize = CorpusSnapshot.summarize
+
+    def vector(self, chunk_id):
+        """Float16 vector of a chunk as a tuple of floats"""
+        if not self.dim:
+            return None
+        offset = self._sections[b"VECS"][0] + chunk_id * self.dim * 2
+        return struct.unpack_from(f"<{self.dim}e", self._mm, offset)
+
+    def vector_matrix(self):
+        """The VECS section as a (chunks, dim) float16 array over the mapped file"""
+        if self._vector_matrix is None:
+            offset = self._sections[b"VECS"][0]
+            matrix = np.frombuffer(self._mm, np.dtype("<f2"), len(self) * self.dim, offset)
+            self._vector_matrix = matrix.reshape(len(self), self.dim)
+        return self._vector_matrix
+
+    def searchable(self):
+        """Boolean array of the chunks with a vector of their own, i.e. not duplicates"""
+        if self._searchable is None:
+            searchable = np.ones(len(self), bool)
+            searchable[[c for ids in self.copies.values() for c in ids]] = False
+            self._searchable = searchable
+        return self._searchable
+
+    def signature(self, chunk_id):
+        offset = self._sections[b"SIGS"][0] + chunk_id * NUM_PERM * 4
+        return array("I", self._mm[offset:offset + NUM_PERM * 4])
+
+    def doc_signature(self, doc_index):
+        offset = self._sections[b"DSIG"][0] + doc_index * NUM_PERM * 4
+        return array("I", self._mm[offset:offset + NUM_PERM * 4])
+
+    def chunk_signatures(self):
+        """(chunk id, signature) for every chunk that is not a duplicate"""
+        for chunk_id in range(len(self)):
+            if self._chunk_row(chunk_id)[5] < 0:
+                yield chunk_id, self.signature(chunk_id)
+
+    def document_signatures(self):
+        """(document name, signature) for every document"""
+        for i, name in enumerate(self.doc_names):
+            yield name, self.doc_signature(i)
+
+    def _chunk_row(self, chunk_id):
+        return CHUNK_ROW.unpack_from(self._mm, self._sections[b"CHNK"][0] + chunk_id * CHUNK_ROW.size)
+
+    def _term_row(self, i):
+        return TERM_ROW.unpack_from(self._mm, self._sections[b"TIDX"][0] + i * TERM_ROW.size)
+
+    def _term_at(self, i, row=None):
+        term_offset, _, term_len, _, _ = row or self._term_row(i)
+        start = self._sections[b"TSTR"][0] + term_offset
+        return self._mm[start:start + term_len].decode("utf-8")
+
+    def _find_term(self, term):
+        lo, hi = 0, self.meta["terms"]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = self._term_row(mid)
+            found = self._term_at(mid, row)
+            if found == term:
+                return row
+            if found < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+
+def open_index(path):
+    """Memory-map an index file for querying"""
+    return MappedIndex(path)
+
+def load_corpus(path):
+    """Open an index file as a mutable Corpus backed by the mapped file"""
+    index = open_index(path)
+    return Corpus(dedup=index.meta["dedup"], base=index)
+
+
+# Benchmark
+def build_synthetic(path, chunks, dim, vocab=50000, terms_per_chunk=5):
+    """Write a synthetic index with the given number of chunks"""
+    postings = [array("I") for _ in range(vocab)]
+    for chunk_id in range(chunks):
+        for j in range(terms_per_chunk):
+            postings[(chunk_id * 7 + j * 7919) % vocab].append(chunk_id)
+    docs = max(1, chunks // 200)
+    meta = {
+        "documents": [[f"doc{d}.txt", None, 1, d * 200, min(200, chunks - d * 200), 0] for d in range(docs)],
+        "duplicates": {}, "copies": [], "dedup": False, "memory_bytes": 0,
+    }
+    terms = ((f"term{t:06d}", dict.fromkeys(postings[t], 1)) for t in range(vocab))
+    rows = ((min(i // 200, docs - 1), 1, terms_per_chunk, -1) for i in range(chunks))
+    texts = (f"synthetic chunk {i}" for i in range(chunks))
+    vectors = ([((i + k) % 17) / 17.0 for k in range(dim)] for i in range(chunks)) if dim else None
+    write_sections(path, meta, terms, rows, texts, vectors=vectors, dim=dim)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-load benchmark for the index format")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=32, help="vector dimensions (0 for none)")
+    parser.add_argument("--path", help="where to write the benchmark index (default: a temp dir)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path or os.path.join(tmp, "bench.simx")
+        start = time.perf_counter()
+        build_synthetic(path, args.chunks, args.dim)
+        print(f"build: {args.chunks:,} chunks, {os.path.getsize(path) / 1024 / 1024:.1f} MB "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        index = open_index(path)
+        opened = time.perf_counter()
+        hits = index.search("term000123 term004567", k=5)
+        searched = time.perf_counter()
+        index.citations(hits)
+        if args.dim:
+            index.vector(args.chunks - 1)
+        done = time.perf_counter()
+        print(f"open: {(opened - start) * 1000:.2f} ms, first query: {(searched - opened) * 1000:.2f} ms, "
+              f"citations + vector: {(done - searched) * 1000:.2f} ms")
+        index.close()
+
+        start = time.perf_counter()
+        corpus = load_corpus(path)
+        opened = time.perf_counter()
+        corpus.search("term000123 term004567", k=5)
+        searched = time.perf_counter()
+        corpus.add_document("new.txt", "synthetic term000123 added after loading")
+        done = time.perf_counter()
+        print(f"load_corpus: {(opened - start) * 1000:.2f} ms, first query: {(searched - opened) * 1000:.2f} ms, "
+              f"first ingest: {(done - searched) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""Load-test harness for the Simplify Streamlit apps.
+
+Starts the app under test with `streamlit run` and drives concurrent
+scripted sessions against that one server over Streamlit's websocket
+protocol, the way browser tabs would, then reports throughput, latency
+percentiles and the server process's RSS for each session count:
+
+    python simplify_loadtest.py --app simplify_v2.py --sessions 1,2,4,8,16
+    python simplify_loadtest.py --app simplify_app.py --sessions 1,4,16 --json results.json
+
+Each session does upload -> ingest -> ask a suggestion -> ask a follow-up.
+The upload goes through the app's file uploader and the server's upload
+endpoint, and ingest clicks the app's own button. simplify_app.py has no
+real ingestion: its "Generate Summary" button only extracts the text
+(after a fixed 2 s sleep), and it is reported as such.
+
+Every load level gets a fresh server in a scratch working directory, so
+workspaces and indexes from one level do not leak into the next. RSS is
+that one server process's, read from /proc: the baseline after a warm-up
+session has imported the app, and the peak while the level runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+APPS = ("simplify_v2.py", "simplify_app.py")
+STEPS = ("load", "ingest", "ask_suggestion", "ask_follow_up")
+FOLLOW_UP = "What methodology was used to measure that?"
+STARTUP_TIMEOUT = 60.0
+
+SAMPLE_TEXT = """Spaceflight alters genome DNA methylation in mouse liver and retina.
+We found that the epigenomic regulators Tet2 and Dnmt3a differentially
+condition the spaceflight response. Methylation was measured by reduced
+representation bisulfite sequencing across three cohorts. The principal
+immune response generated during deep space exposures is suggested to be
+an inflammatory response driven by innate immunity. Hydrated magnesium
+sulfate mineral levels can reach a maximum concentration of about forty
+weight percent in the equatorial regolith. """
+
+
+def process_rss(pid):
+    """Resident set size of a process in bytes, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Server
+class AppServer:
+    """`streamlit run` for one app in a scratch working directory"""
+
+    def __init__(self, app_path, workdir):
+        self.app_path = app_path
+        self.workdir = workdir
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def start(self):
+        import requests
+
+        self.log = open(os.path.join(self.workdir, "server.log"), "wb")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", self.app_path,
+             "--server.headless", "true", "--server.port", str(self.port),
+             "--server.address", "127.0.0.1", "--server.enableXsrfProtection", "false",
+             "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+            cwd=self.workdir, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if requests.get(f"{self.url}/_stcore/health", timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"streamlit did not start; see {self.log.name}")
+
+    def rss(self):
+        return process_rss(self.process.pid)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+
+
+# Headless client
+class Session:
+    """One browser tab: a websocket to the server and the widget values it has set"""
+
+    def __init__(self, server, timeout):
+        self.server = server
+        self.timeout = timeout
+        self.ws = None
+        self.session_id = None
+        self.elements = {}      # delta path -> Element of the last complete run
+        self.values = {}        # widget id -> WidgetState the tab keeps sending
+
+    async def open(self):
+        from websockets.asyncio.client import connect
+
+        self.ws = await connect(f"ws://127.0.0.1:{self.server.port}/_stcore/stream",
+                                subprotocols=["streamlit"], max_size=None)
+        await self.rerun()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, trigger=None):
+        """Send the widget values (plus a button click) and wait for the script to finish"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        states = msg.rerun_script.widget_states
+        states.SetInParent()    # an empty rerun request still has to be sent as one
+        for state in self.values.values():
+            states.widgets.add().CopyFrom(state)
+        if trigger is not None:
+            states.widgets.add(id=trigger, trigger_value=True)
+        await self.ws.send(msg.SerializeToString())
+
+        elements = {}
+        while True:
+            fwd = await self._receive()
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                # st.rerun() starts a new run without another request
+                self.session_id = fwd.new_session.initialize.session_id or self.session_id
+                elements = {}
+            elif kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                elements[tuple(fwd.metadata.delta_path)] = fwd.delta.new_element
+            elif kind == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                self.elements = elements
+                if fwd.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("script failed to compile")
+                errors = [e.exception.message for e in elements.values()
+                          if e.WhichOneof("type") == "exception"]
+                if errors:
+                    raise RuntimeError(errors[0])
+                return
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        fwd = ForwardMsg()
+        fwd.ParseFromString(await asyncio.wait_for(self.ws.recv(), self.timeout))
+        return fwd
+
+    def widget(self, kind, label=None, key=None):
+        """The first widget of a kind ("button", "text_input", ...) with this label or key"""
+        for element in self.elements.values():
+            if element.WhichOneof("type") == kind:
+                widget = getattr(element, kind)
+                if (label is None or widget.label == label) and \
+                        (key is None or widget.id.endswith(f"-{key}")):
+                    return widget
+        raise LookupError(f"No {kind} with label {label!r} and key {key!r}")
+
+    def texts(self, kind):
+        """Bodies of the markdown or alert elements on the page"""
+        return [getattr(e, kind).body for e in self.elements.values() if e.WhichOneof("type") == kind]
+
+    async def click(self, kind="button", label=None, key=None):
+        await self.rerun(trigger=self.widget(kind, label, key).id)
+
+    def type(self, kind, key, text):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        self.values[self.widget(kind, key=key).id] = WidgetState(
+            id=self.widget(kind, key=key).id, string_value=text)
+
+    async def upload(self, name, data):
+        """Put a file in the page's file uploader, as dropping it on the widget would"""
+        import requests
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        uploader = self.widget("file_uploader")
+        msg = BackMsg()
+        request_id = uuid.uuid4().hex
+        msg.file_urls_request.request_id = request_id
+        msg.file_urls_request.session_id = self.session_id
+        msg.file_urls_request.file_names.append(name)
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            fwd = await self._receive()
+            if fwd.WhichOneof("type") == "file_urls_response" and fwd.file_urls_response.response_id == request_id:
+                break
+        if fwd.file_urls_response.error_msg:
+            raise RuntimeError(fwd.file_urls_response.error_msg)
+        urls = fwd.file_urls_response.file_urls[0]
+        response = await asyncio.to_thread(
+            requests.put, self.server.url + urls.upload_url, files={"file": (name, data)},
+            timeout=self.timeout)
+        response.raise_for_status()
+
+        state = WidgetState(id=uploader.id)
+        info = state.file_uploader_state_value.uploaded_file_info.add(
+            name=name, size=len(data), file_id=urls.file_id)
+        info.file_urls.CopyFrom(urls)
+        self.values[uploader.id] = state
+        await self.rerun()
+
+
+# Scripted sessions
+def upload_name(doc_name, session_id):
+    """A session's own name for the document, keeping its extension, which picks the parser"""
+    stem, ext = os.path.splitext(os.path.basename(doc_name))
+    return f"{stem}-{session_id}{ext}"
+
+def v2_steps(session, session_id, doc):
+    """Steps for one simplify_v2.py session: [(step, coroutine function)]"""
+
+    async def ingest():
+        await session.upload(upload_name(doc[0], session_id), doc[1])
+        await session.click(label="🚀 Ingest Documents")
+        if not any("ingested successfully" in text for text in session.texts("alert")):
+            raise RuntimeError("no ingest confirmation")
+
+    async def ask(question):
+        before = sum('class="message-ai"' in text for text in session.texts("markdown"))
+        session.type("text_input", "user_input", question)
+        await session.click(label="↑")
+        if sum('class="message-ai"' in text for text in session.texts("markdown")) <= before:
+            raise RuntimeError("no answer was added")
+
+    async def ask_suggestion():
+        # The first Quick Start suggestion, as a user clicking it would
+        suggestion = session.widget("button", key="sugg_0").label
+        await session.click(key="sugg_0")
+        await ask(suggestion)
+
+    return [("load", session.open), ("ingest", ingest), ("ask_suggestion", ask_suggestion),
+            ("ask_follow_up", lambda: ask(FOLLOW_UP))]
+
+def app_steps(session, session_id, doc):
+    """Steps for one simplify_app.py session: [(step, coroutine function)]"""
+
+    async def ingest():
+        await session.upload(upload_name(doc[0], session_id), doc[1])
+        await session.click(label="🚀 Generate Summary")
+        if not any("processed successfully" in text for text in session.texts("alert")):
+            raise RuntimeError("no processing confirmation")
+
+    async def ask(click):
+        before = sum("ai-message" in text for text in session.texts("markdown"))
+        await click()
+        if sum("ai-message" in text for text in session.texts("markdown")) <= before:
+            raise RuntimeError("no answer was added")
+
+    async def ask_follow_up():
+        session.type("text_area", "chat_input", FOLLOW_UP)
+        await ask(lambda: session.click(label="Send Message"))
+
+    return [("load", session.open), ("ingest", ingest),
+            ("ask_suggestion", lambda: ask(lambda: session.click(label="What are the main points?"))),
+            ("ask_follow_up", ask_follow_up)]
+
+async def run_session(server, session_id, doc, timeout):
+    """Run one scripted session; returns [(step, ms, error or None)]"""
+    script = v2_steps if os.path.basename(server.app_path) == "simplify_v2.py" else app_steps
+    session = Session(server, timeout)
+    results = []
+    try:
+        for step, fn in script(session, session_id, doc):
+            start = time.perf_counter()
+            error = None
+            try:
+                await fn()
+            except Exception as e:
+                error = str(e) or repr(e)
+            results.append((step, (time.perf_counter() - start) * 1000, error))
+            if error:
+                break
+    finally:
+        await session.close()
+    return results
+
+
+# Load levels
+async def _drive(server, sessions, doc, timeout, level_id):
+    warm_up = Session(server, timeout)
+    await warm_up.open()    # imports the app's modules, which is not per-session cost
+    await warm_up.close()
+    baseline = peak = server.rss()
+
+    async def sample():
+        nonlocal peak
+        while True:
+            rss = server.rss()
+            if rss is not None:
+                peak = max(peak, rss)
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    outputs = await asyncio.gather(*(run_session(server, f"{level_id}-{i}", doc, timeout)
+                                     for i in range(sessions)))
+    wall = time.perf_counter() - start
+    sampler.cancel()
+    end = server.rss()
+    if end is not None:
+        peak = max(peak, end)
+    return outputs, wall, baseline, peak
+
+def run_level(app_path, sessions, doc, timeout, level_id, workdir=None):
+    """Start a server, run `sessions` concurrent sessions against it and summarize them"""
+    with tempfile.TemporaryDirectory(prefix="simplify-loadtest-") as scratch:
+        server = AppServer(app_path, workdir or scratch).start()
+        try:
+            outputs, wall, baseline, peak = asyncio.run(
+                _drive(server, sessions, doc, timeout, level_id))
+        finally:
+            server.stop()
+
+    latencies = {step: [] for step in STEPS}
+    errors = []
+    completed = 0
+    for results in outputs:
+        for step, ms, error in results:
+            if error:
+                errors.append(f"{step}: {error}")
+            elif step in latencies:
+                latencies[step].append(ms)
+        if len(results) == len(STEPS) and not any(error for _, _, error in results):
+            completed += 1
+
+    every = [ms for values in latencies.values() for ms in values]
+    mb = lambda n: round(n / 1024 / 1024, 2) if n is not None else None
+    return {
+        "sessions": sessions,
+        "completed": completed,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "sessions_per_s": round(completed / wall, 3) if wall else None,
+        "steps_per_s": round(len(every) / wall, 3) if wall else None,
+        "latency_ms": {
+            step: {p: round(percentile(values, n), 2) if values else None
+                   for p, n in (("p50", 50), ("p95", 95), ("p99", 99))}
+            for step, values in list(latencies.items()) + [("all", every)]
+        },
+        "rss_baseline_mb": mb(baseline),
+        "rss_mb": mb(peak),
+        "rss_per_session_mb": mb((peak - baseline) / sessions) if peak is not None else None,
+    }
+
+def print_report(app_path, levels):
+    print(f"\n{app_path} (one streamlit server per level)")
+    if os.path.basename(app_path) == "simplify_app.py":
+        print("note: simplify_app.py has no real ingestion; 'ingest' is its Generate Summary "
+              "button, which sleeps 2 s and only extracts text")
+    print(f"{'sessions':>8} {'done':>5} {'sess/s':>7} {'steps/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>7} {'MB/sess':>8}")
+    for level in levels:
+        overall = level["latency_ms"]["all"]
+        print(f"{level['sessions']:>8} {level['completed']:>5} {level['sessions_per_s'] or 0:>7.2f} "
+              f"{level['steps_per_s'] or 0:>8.2f} {overall['p50'] or 0:>8.1f} {overall['p95'] or 0:>8.1f} "
+              f"{overall['p99'] or 0:>8.1f} {level['rss_mb'] or 0:>7.1f} {level['rss_per_session_mb'] or 0:>8.2f}")
+    print("\np99 by step (ms):")
+    print(f"{'sessions':>8} " + " ".join(f"{step:>15}" for step in STEPS))
+    for level in levels:
+        print(f"{level['sessions']:>8} " + " ".join(
+            f"{level['latency_ms'][step]['p99'] or 0:>15.1f}" for step in STEPS))
+    for level in levels:
+        for error in level["errors"][:5]:
+            print(f"  [{level['sessions']} sessions] {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the Simplify apps")
+    parser.add_argument("--app", choices=APPS, action="append",
+                        help="app to test (repeatable; default: both)")
+    parser.add_argument("--sessions", default="1,2,4,8",
+                        help="comma-separated concurrent session counts")
+    parser.add_argument("--doc", help="document to ingest, uploaded under its own extension "
+                                      "(default: built-in sample text)")
+    parser.add_argument("--doc-repeat", type=int, default=50,
+                        help="repeat the built-in sample this many times")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds to wait for any one server response")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--workdir", help="run the servers here and keep their workspaces and logs "
+                                          "(default: a scratch directory removed after each level)")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    if args.doc:
+        with open(args.doc, "rb") as f:
+            doc = (args.doc, f.read())
+    else:
+        doc = ("paper.txt", (SAMPLE_TEXT * args.doc_repeat).encode("utf-8"))
+    counts = [int(n) for n in args.sessions.split(",") if n.strip()]
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+
+    report = {}
+    run_id = int(time.time())
+    for app in args.app or APPS:
+        app_path = os.path.join(here, app)
+        levels = [run_level(app_path, n, doc, args.timeout, f"{run_id}-{n}", args.workdir)
+                  for n in counts]
+        print_report(app, levels)
+        report[app] = {"levels": levels}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Hybrid query planning for the chat path.
+
+A query runs in stages against one corpus (a Corpus or a MappedIndex):
+
+1. lexical   - TF-IDF over the inverted index, good at exact terms
+2. dense     - cosine over hashed chunk vectors, recalls related word forms;
+               the query is embedded once and the full scan runs in numpy
+               blocks with the clock checked between them, and when the
+               running per-chunk cost says it cannot finish in the budget
+               only the lexical candidates are scored
+3. fuse      - reciprocal rank fusion of the two candidate lists
+4. re-rank   - a costlier scorer over the fused top candidates: query term
+               coverage, exact bigram matches and how tightly the matches
+               cluster in the chunk
+
+Every stage after the first checks the per-query latency budget first and
+is skipped once the budget is spent, so a slow query degrades to the
+cheaper ranking instead of running long. Re-ranking also stops part-way
+when the budget runs out, leaving the remaining candidates in fused order.
+
+The cost estimates live on the planner, so callers should share one per
+corpus through planner_for() rather than build one per query.
+"""
+import heapq
+import threading
+import time
+import weakref
+from simplify_corpus import embed, split_sentences, tokenize
+
+CANDIDATES = 50
+RRF_K = 60
+RERANK_TOP = 20
+DENSE_BLOCK = 2048
+LATENCY_BUDGET_MS = 150.0
+
+
+class RetrievalResult:
+    """Ranked hits for one query plus what the planner did to get them"""
+
+    def __init__(self, query, hits, stages, timings, degraded, corpus=None):
+        self.query = query
+        self.hits = hits            # [(chunk id, score)]
+        self.stages = stages        # stages that ran, in order
+        self.timings = timings      # stage -> milliseconds
+        self.degraded = degraded    # True when a stage was skipped or cut short
+        self.corpus = corpus        # snapshot the hits refer to; take citations and text from it
+
+    def __repr__(self):
+        return (f"RetrievalResult({len(self.hits)} hits, stages={self.stages}, "
+                f"degraded={self.degraded})")
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse several [(id, score)] rankings by summing 1 / (k + rank)"""
+    fused = {}
+    for ranking in rankings:
+        for rank, (key, _) in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def rerank_score(query_terms, query_bigrams, text):
+    """Score a chunk text by term coverage, exact bigrams and match proximity"""
+    tokens = tokenize(text)
+    if not tokens or not query_terms:
+        return 0.0
+    positions = {}
+    for i, token in enumerate(tokens):
+        if token in query_terms:
+            positions.setdefault(token, []).append(i)
+    coverage = len(positions) / len(query_terms)
+    bigrams = sum(1 for pair in zip(tokens, tokens[1:]) if pair in query_bigrams)
+
+    # Shortest window containing one occurrence of each matched term
+    proximity = 0.0
+    if len(positions) > 1:
+        events = sorted((pos, term) for term, plist in positions.items() for pos in plist)
+        counts = {}
+        best = len(tokens)
+        left = 0
+        for pos, term in events:
+            counts[term] = counts.get(term, 0) + 1
+            while len(counts) == len(positions):
+                best = min(best, pos - events[left][0] + 1)
+                left_term = events[left][1]
+                counts[left_term] -= 1
+                if not counts[left_term]:
+                    del counts[left_term]
+                left += 1
+        proximity = len(positions) / best
+    return 2.0 * coverage + 0.5 * min(bigrams, 4) + proximity
+
+
+class HybridPlanner:
+    """Plans lexical + dense retrieval with fusion and budgeted re-ranking"""
+
+    def __init__(self, corpus, candidates=CANDIDATES, rerank_top=RERANK_TOP,
+                 budget_ms=LATENCY_BUDGET_MS, rrf_k=RRF_K):
+        self.corpus = corpus
+        self.candidates = candidates
+        self.rerank_top = rerank_top
+        self.budget_ms = budget_ms
+        self.rrf_k = rrf_k
+        self._rerank_ms = 0.2       # running estimate of re-rank cost per candidate
+        self._dense_ms = 0.0005     # running estimate of dense scan cost per chunk
+
+    def retrieve(self, query, k=5, budget_ms=None, docs=None):
+        """Run the plan for one query and return a RetrievalResult"""
+        corpus = self.corpus.snapshot()
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000.0
+        start = time.perf_counter()
+        deadline = start + budget
+        stages, timings = [], {}
+        degraded = False
+
+        def timed(stage, fn, *args):
+            t = time.perf_counter()
+            result = fn(*args)
+            timings[stage] = round((time.perf_counter() - t) * 1000, 3)
+            stages.append(stage)
+            return result
+
+        lexical = timed("lexical", corpus.search, query, self.candidates, docs)
+        rankings = [lexical]
+        if time.perf_counter() < deadline:
+            dense, finished = timed("dense", self._dense, corpus, query, docs, lexical, deadline)
+            rankings.append(dense)
+            degraded = degraded or not finished
+        else:
+            degraded = True
+
+        if len(rankings) > 1:
+            fused = timed("fuse", reciprocal_rank_fusion, rankings, self.rrf_k)
+        else:
+            fused = lexical
+
+        top = fused[:max(k, self.rerank_top)]
+        remaining = deadline - time.perf_counter()
+        if top and remaining > self._rerank_ms / 1000.0 * min(len(top), self.rerank_top):
+            top, finished = timed("rerank", self._rerank, corpus, query, top, deadline)
+            degraded = degraded or not finished
+        elif top:
+            degraded = True
+
+        timings["total"] = round((time.perf_counter() - start) * 1000, 3)
+        return RetrievalResult(query, top[:k], stages, timings, degraded, corpus)
+
+    def _dense(self, corpus, query, docs, lexical, deadline):
+        q = embed(query)
+        total = len(corpus.vectors)
+        remaining_ms = (deadline - time.perf_counter()) * 1000
+        if total * self._dense_ms > remaining_ms:
+            # Cannot scan everything in time: score the lexical candidates only.
+            # Their cost says little about a full scan's, so let the estimate
+            # decay instead, which tries a full scan again now and then
+            self._dense_ms *= 0.9
+            return corpus.dense_search(query, self.candidates, docs, ids=_indexed(corpus, lexical), q=q), False
+        hits = []
+        scanned = 0
+        t = time.perf_counter()
+        while scanned < total and time.perf_counter() < deadline:
+            block = range(scanned, min(scanned + DENSE_BLOCK, total))
+            hits = heapq.nlargest(self.candidates, hits + corpus.dense_search(query, self.candidates, docs, block, q),
+                                  key=lambda hit: hit[1])
+            scanned = block.stop
+        self._observe_dense(t, scanned)
+        if scanned == total:
+            return hits, True
+        # Out of time part-way: make sure the lexical candidates are scored too
+        seen = set(_indexed(corpus, hits))
+        extra = corpus.dense_search(query, self.candidates, docs,
+                                    ids=[c for c in _indexed(corpus, lexical) if c >= scanned and c not in seen], q=q)
+        return heapq.nlargest(self.candidates, hits + extra, key=lambda hit: hit[1]), False
+
+    def _observe_dense(self, started, chunks):
+        if chunks:
+            per_chunk = (time.perf_counter() - started) * 1000 / chunks
+            self._dense_ms = 0.8 * self._dense_ms + 0.2 * per_chunk
+
+    def _rerank(self, corpus, query, fused, deadline):
+        terms = list(dict.fromkeys(tokenize(query)))
+        query_terms = set(terms)
+        query_bigrams = set(zip(terms, terms[1:]))
+        head = fused[:self.rerank_top]
+        rescored = []
+        t = time.perf_counter()
+        for chunk_id, _ in head:
+            if time.perf_counter() >= deadline:
+                break
+            text = corpus.chunks[chunk_id]["text"]
+            rescored.append((chunk_id, rerank_score(query_terms, query_bigrams, text)))
+        if rescored:
+            per_candidate = (time.perf_counter() - t) * 1000 / len(rescored)
+            self._rerank_ms = 0.8 * self._rerank_ms + 0.2 * per_candidate
+        finished = len(rescored) == len(head)
+        # Stable sort: fused order breaks ties between equally good chunks
+        rescored.sort(key=lambda item: item[1], reverse=True)
+        return rescored + head[len(rescored):] + fused[len(head):], finished
+
+
+def _indexed(corpus, hits):
+    """Chunk ids of hits, with a document's copy of a shared passage mapped to the indexed chunk"""
+    return list(dict.fromkeys(corpus.chunks[c].get("duplicate_of", c) for c, _ in hits))
+
+
+_planners = weakref.WeakKeyDictionary()
+_planners_lock = threading.Lock()
+
+def planner_for(corpus):
+    """The HybridPlanner shared by every query against a corpus"""
+    with _planners_lock:
+        planner = _planners.get(corpus)
+        if planner is None:
+            planner = _planners[corpus] = HybridPlanner(corpus)
+        return planner
+
+
+def answer_from_hits(corpus, query, hits, sentences=2):
+    """Extractive answer: the sentences in the top hits that best cover the query"""
+    query_terms = set(tokenize(query))
+    scored = []
+    seen = set()
+    for rank, (chunk_id, _) in enumerate(hits):
+        for sentence in split_sentences(corpus.chunks[chunk_id]["text"]):
+            if sentence in seen:
+                continue
+            seen.add(sentence)
+            overlap = len(query_terms.intersection(tokenize(sentence)))
+            if overlap:
+                # Earlier hits win ties
+                scored.append((overlap, -rank, sentence))
+    scored.sort(reverse=True)
+    return " ".join(sentence for _, _, sentence in scored[:sentences])
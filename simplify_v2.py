@@ -1,9 +1,17 @@
 import streamlit as st
+import io
 import os
 import tempfile
-from PyPDF2 import PdfReader
-import docx
 import time
+import uuid
+from simplify_batch import run_batch
+from simplify_context import ConversationContext
+from simplify_retrieval import answer_from_hits, planner_for
+from simplify_viewer import data_url, view_citation
+from simplify_workspaces import WORKSPACE_ID_RE, QuotaExceeded, default_manager
+
+SESSION_WORKSPACE_PREFIX = "session-"
+SESSION_WORKSPACE_TTL = 24 * 3600   # seconds a session's private workspace is kept after its last use
 
 # Page configuration - Same layout as React
 st.set_page_config(
@@ -104,6 +112,16 @@ if 'selected_citation' not in st.session_state:
     st.session_state.selected_citation = None
 if 'pdf_url' not in st.session_state:
     st.session_state.pdf_url = None
+if 'session_workspace' not in st.session_state:
+    # Every session starts in its own private workspace; those of sessions long gone are deleted
+    default_manager().expire(SESSION_WORKSPACE_TTL, prefix=SESSION_WORKSPACE_PREFIX)
+    st.session_state.session_workspace = f"{SESSION_WORKSPACE_PREFIX}{uuid.uuid4().hex}"
+if 'workspace' not in st.session_state:
+    st.session_state.workspace = st.session_state.session_workspace
+if 'context' not in st.session_state:
+    st.session_state.context = ConversationContext()
+if 'batch_results' not in st.session_state:
+    st.session_state.batch_results = None
 
 # Quick suggestions - Same as React
 quick_suggestions = [
@@ -113,54 +131,36 @@ quick_suggestions = [
     "What is the maximum concentration that hydrated magnesium sulfate mineral levels can reach?"
 ]
 
-# File processing functions
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF file"""
-    text = ""
-    try:
-        with open(file_path, 'rb') as file:
-            reader = PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        return f"Error reading PDF: {str(e)}"
+# Workspaces - one corpus and uploads directory per user or team, shared by the whole process
+SAVE_DELAY = 2.0   # seconds an ingested index waits in memory before it is written out
 
-def extract_text_from_txt(file_path):
-    """Extract text from TXT file"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except Exception as e:
-        return f"Error reading text file: {str(e)}"
-
-def extract_text_from_docx(file_path):
-    """Extract text from DOCX file"""
-    try:
-        doc = docx.Document(file_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except Exception as e:
-        return f"Error reading DOCX: {str(e)}"
+def get_workspace_manager():
+    return default_manager()
 
 def process_file(file):
-    """Process uploaded file and extract text"""
-    os.makedirs("uploads", exist_ok=True)
-    file_path = os.path.join("uploads", file.name)
-    
-    with open(file_path, "wb") as f:
-        f.write(file.getbuffer())
-    
-    if file.name.lower().endswith('.pdf'):
-        return extract_text_from_pdf(file_path)
-    elif file.name.lower().endswith('.txt'):
-        return extract_text_from_txt(file_path)
-    elif file.name.lower().endswith('.docx'):
-        return extract_text_from_docx(file_path)
-    else:
-        return "Unsupported file format"
+    """Store an uploaded file in the current workspace, index it and return its text"""
+    manager = get_workspace_manager()
+    workspace = st.session_state.workspace
+    manager.ingest_file(workspace, file.name, file.getvalue())
+    return manager.corpus(workspace).document_text(os.path.basename(file.name))
+
+def answer_query(query):
+    """Answer a question from the current workspace's documents; returns (text, citations)"""
+    workspace = st.session_state.workspace
+    corpus = get_workspace_manager().corpus(workspace)
+    if not len(corpus):
+        return generate_mock_response(query), []
+    # Follow-ups borrow key terms from recent turns and the summary of older ones
+    context = st.session_state.context
+    search_query = context.follow_up_query(query)
+    result = context.retrieve(
+        (workspace, search_query, corpus.version),
+        lambda: planner_for(corpus).retrieve(search_query, k=3)
+    )
+    if not result.hits:
+        return "I couldn't find anything about that in your documents.", []
+    answer = answer_from_hits(result.corpus, query, result.hits) or generate_mock_response(query)
+    return answer, result.corpus.citations(result.hits)
 
 def generate_mock_response(query):
     """Generate mock AI response similar to React version"""
@@ -203,6 +203,7 @@ with col1:
         st.session_state.messages = []
         st.session_state.current_chat_id = None
         st.session_state.uploaded_files = []
+        st.session_state.context = ConversationContext()
         st.rerun()
     
     # Chat history list
@@ -212,6 +213,7 @@ with col1:
             if st.button(f"💬 {chat.get('title', 'Chat')}", key=chat.get('id'), use_container_width=True):
                 st.session_state.messages = chat.get('messages', [])
                 st.session_state.current_chat_id = chat.get('id')
+                st.session_state.context = ConversationContext.from_messages(st.session_state.messages)
     else:
         st.info("No chat history yet")
 
@@ -233,8 +235,8 @@ with col2:
         
         # Quick suggestions
         st.markdown("### Quick Start")
-        for suggestion in quick_suggestions:
-            if st.button(suggestion, key=f"sugg_{suggestion[:10]}", use_container_width=True):
+        for i, suggestion in enumerate(quick_suggestions):
+            if st.button(suggestion, key=f"sugg_{i}", use_container_width=True):
                 st.session_state.input = suggestion
                 st.rerun()
         
@@ -256,6 +258,18 @@ with col2:
                 </div>
                 """, unsafe_allow_html=True)
             else:
+                # Citations - Same as React
+                citations_html = ''
+                if message.get('citations'):
+                    citations_html = """
+                    <div style="margin-top: 15px;">
+                        <div style="display: flex; align-items: center; gap: 5px; color: #666;">
+                            <span>📚</span>
+                            <strong>Sources</strong>
+                        </div>
+                    </div>
+                    """
+                
                 st.markdown(f"""
                 <div class="message-ai">
                     <div style="display: flex; align-items: center; gap: 10px; margin-bottom: 10px;">
@@ -266,27 +280,21 @@ with col2:
                         <span style="margin-left: auto; color: #666; font-size: 0.8rem;">{message.get('timestamp', '')}</span>
                     </div>
                     <div>{message['text']}</div>
-                    
-                    {/* Citations - Same as React */}
-                    {message.get('citations') and f"""
-                    <div style="margin-top: 15px;">
-                        <div style="display: flex; align-items: center; gap: 5px; margin-bottom: 10px; color: #666;">
-                            <span>📚</span>
-                            <strong>Sources</strong>
-                        </div>
-                        <div>
-                            {' '.join([f'<button class="citation-chip" onclick="alert(\'Source {i+1}\')">{cit.get("title", "Source")}</button>' for i, cit in enumerate(message.get("citations", []))])}
-                        </div>
-                    </div>
-                    """ or ''}
-                    
-                    {/* Message actions - Same as React */}
+                    {citations_html}
                     <div style="display: flex; gap: 10px; margin-top: 15px;">
                         <button style="background: none; border: 1px solid #0B3D91; padding: 5px 10px; border-radius: 5px; cursor: pointer;">🔊 Read</button>
                         <button style="background: none; border: 1px solid #0B3D91; padding: 5px 10px; border-radius: 5px; cursor: pointer;">📋 Copy</button>
                     </div>
                 </div>
                 """, unsafe_allow_html=True)
+                
+                # Citation chips open the source viewer
+                if message.get('citations'):
+                    chip_cols = st.columns(len(message['citations']))
+                    for i, cit in enumerate(message['citations']):
+                        with chip_cols[i]:
+                            if st.button(cit.get("title", "Source"), key=f"cite_{message['id']}_{i}", use_container_width=True):
+                                st.session_state.selected_citation = cit
     
     # Loading indicator
     if st.session_state.loading:
@@ -309,9 +317,84 @@ with col2:
         </div>
         """, unsafe_allow_html=True)
 
+    # Batch Q&A - one question set against every document in the workspace
+    with st.expander("📊 Batch Q&A"):
+        batch_questions = st.text_area(
+            "Questions (one per line)",
+            value="\n".join(quick_suggestions),
+            key="batch_questions",
+            height=120
+        )
+        if st.button("Run on all documents", key="batch_run", use_container_width=True):
+            try:
+                corpus = get_workspace_manager().corpus(st.session_state.workspace)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if not corpus.documents:
+                    st.error("Please ingest documents first")
+                else:
+                    with st.spinner("Answering across documents..."):
+                        st.session_state.batch_results = run_batch(corpus, batch_questions.splitlines())
+        
+        table = st.session_state.batch_results
+        if table is not None and len(table):
+            st.caption(f"{len(table.documents)} documents × {len(table.questions)} questions "
+                       f"in {table.elapsed_ms:.0f} ms")
+            compare = st.selectbox("Compare", ["All questions"] + table.questions, key="batch_compare")
+            view = table if compare == "All questions" else table.compare(compare)
+            if st.checkbox("Answered only", key="batch_answered"):
+                view = view.where(answered=True)
+            st.dataframe(view.to_pandas(), use_container_width=True, hide_index=True)
+            
+            csv_buffer = io.StringIO()
+            view.to_csv(csv_buffer)
+            st.download_button("⬇️ Export CSV", csv_buffer.getvalue(), file_name="batch_answers.csv",
+                               mime="text/csv", use_container_width=True)
+
 with col3:
+    # Source viewer - renders only the cited page and its neighbours
+    citation = st.session_state.selected_citation
+    if citation:
+        st.markdown("### Source")
+        st.caption(citation.get('title', 'Source'))
+        path = citation.get('path')
+        if path and path.lower().endswith('.pdf') and os.path.exists(path):
+            cited = citation.get('page', 1)
+            pages = view_citation(path, cited)
+            pages.sort(key=lambda p: p['page'] != cited)  # cited page first
+            tabs = st.tabs([f"p. {p['page']}" for p in pages])
+            for tab, page in zip(tabs, pages):
+                with tab:
+                    url = data_url(page['pdf'])
+                    if page['page'] == cited:
+                        st.session_state.pdf_url = url
+                    st.markdown(f'<iframe src="{url}" width="100%" height="500" style="border: none;"></iframe>', unsafe_allow_html=True)
+                    with st.expander("Page text"):
+                        st.write(page['text'])
+        else:
+            st.write(citation.get('text', ''))
+        
+        if st.button("Close Source", use_container_width=True):
+            st.session_state.selected_citation = None
+            st.session_state.pdf_url = None
+            st.rerun()
+        st.markdown("---")
+    
     st.markdown("### Document Upload")
     
+    workspace = st.text_input(
+        "Workspace",
+        value=st.session_state.workspace,
+        help="Documents are stored and searched per workspace. This session's own workspace "
+             "is private; enter a shared name to work on a team's documents"
+    ).strip() or st.session_state.session_workspace
+    if WORKSPACE_ID_RE.match(workspace):
+        st.session_state.workspace = workspace
+    else:
+        st.error(f"Workspace names use letters, digits, '.', '_' and '-' (up to 64 characters); "
+                 f"still using {st.session_state.workspace}")
+    
     # File upload section - Same as React
     st.markdown('<div class="upload-section">', unsafe_allow_html=True)
     
@@ -340,17 +423,24 @@ with col3:
     if st.button("🚀 Ingest Documents", use_container_width=True):
         if uploaded_files:
             with st.spinner("Processing documents..."):
-                time.sleep(2)  # Simulate processing
-                
-                # Process files
+                # Process files - a file that is refused or unreadable does not stop the others
+                ingested = 0
                 for file in uploaded_files:
-                    text = process_file(file)
+                    try:
+                        text = process_file(file)
+                    except (QuotaExceeded, ValueError) as e:
+                        st.error(str(e))
+                        continue
+                    ingested += 1
                     st.session_state.uploaded_files.append({
                         'name': file.name,
                         'text': text[:500] + "..." if len(text) > 500 else text
                     })
-                
-                st.success("✅ Documents ingested successfully!")
+                if ingested:
+                    # Persist the index so a server restart does not mean re-ingesting; the
+                    # write is deferred so back-to-back ingests rewrite it once
+                    get_workspace_manager().save(st.session_state.workspace, delay=SAVE_DELAY)
+                    st.success(f"✅ {ingested} document(s) ingested successfully!")
         else:
             st.error("Please upload files first")
 
@@ -379,34 +469,38 @@ if send_button and user_input.strip():
         "timestamp": time.strftime("%H:%M")
     }
     st.session_state.messages.append(user_message)
+    st.session_state.context.add_turn("user", user_input)
     
-    # Set loading state
+    # Set loading state - the answer is produced on the next run, under the loading indicator
     st.session_state.loading = True
     st.session_state.input = ""
     st.rerun()
-    
-    # Simulate AI processing
-    time.sleep(1)
+
+if st.session_state.loading:
+    question = st.session_state.messages[-1]["text"]
+    try:
+        text, citations = answer_query(question)
+    except ValueError as e:
+        # Answer with the error; leaving loading set would retry it on every rerun
+        text, citations = f"⚠️ {e}", []
     
     # Add AI response
     ai_message = {
         "id": len(st.session_state.messages),
         "type": "ai", 
-        "text": generate_mock_response(user_input),
+        "text": text,
         "timestamp": time.strftime("%H:%M"),
-        "citations": [
-            {"id": 1, "number": 1, "title": "Research Document", "fileName": "document.pdf", "page": 1},
-            {"id": 2, "number": 2, "title": "Source Material", "fileName": "data.txt", "page": 1}
-        ] if st.session_state.uploaded_files else []
+        "citations": citations
     }
     st.session_state.messages.append(ai_message)
+    st.session_state.context.add_turn("ai", text)
     
     # Update chat history
     if st.session_state.current_chat_id is None:
         st.session_state.current_chat_id = f"chat_{int(time.time())}"
         st.session_state.chat_history.append({
             "id": st.session_state.current_chat_id,
-            "title": user_input[:30] + "..." if len(user_input) > 30 else user_input,
+            "title": question[:30] + "..." if len(question) > 30 else question,
             "messages": st.session_state.messages.copy()
         })
     
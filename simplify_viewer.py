@@ -0,0 +1,196 @@
+"""Lazy viewer for cited PDF pages.
+
+Opening a citation should not mean re-reading the whole PDF. The file is
+memory-mapped and handed to PdfReader, which only reads the trailer and
+cross-reference table up front; the cited page and its neighbours are
+then pulled out on demand and each written as a small standalone PDF.
+Both the open readers and the rendered pages sit in small LRU caches, so
+stepping between neighbouring pages or reopening a citation is a cache
+hit.
+"""
+import base64
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+
+NEIGHBOURS = 1
+MAX_OPEN_READERS = 8
+MAX_CACHED_PAGES = 64
+
+INHERITABLE = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+def page_count(reader):
+    """Page count from the root page node, without walking the page tree"""
+    try:
+        return int(reader.trailer["/Root"]["/Pages"]["/Count"])
+    except (KeyError, TypeError, ValueError):
+        return len(reader.pages)
+
+def find_page(reader, index):
+    """Fetch page `index` (0-based) by descending the page tree.
+
+    reader.pages resolves every page object in the document the first
+    time it is used; here each level only resolves the kids needed to
+    find the subtree holding the page, and none at all when a node's
+    kids are all leaves.
+    """
+    try:
+        node = reader.trailer["/Root"]["/Pages"].get_object()
+        inherited = {}
+        while True:
+            for key in INHERITABLE:
+                if key in node:
+                    inherited[key] = node[key]
+            kids = node["/Kids"].get_object()
+            kid = None
+            if int(node["/Count"]) == len(kids):
+                # Every kid holds exactly one page: index straight into them
+                ref = kids[index]
+                kid = ref.get_object()
+                if kid.get("/Type") == "/Pages":
+                    kid = None
+            if kid is None:
+                for ref in kids:
+                    kid = ref.get_object()
+                    count = int(kid["/Count"]) if kid.get("/Type") == "/Pages" else 1
+                    if index < count:
+                        break
+                    index -= count
+                else:
+                    raise IndexError(index)
+            if kid.get("/Type") != "/Pages":
+                leaf = kid
+                break
+            node = kid
+        page = PageObject(reader, ref)
+        page.update(leaf)
+        for key, value in inherited.items():
+            if key not in page:
+                page[key] = value
+        return page
+    except (KeyError, TypeError, AttributeError):
+        return reader.pages[index]
+
+
+class _OpenPdf:
+    """A memory-mapped PDF and the reader parsing it"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reader = PdfReader(self.map)
+        self.lock = threading.Lock()   # PdfReader is not safe to share across threads
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.map.close()
+        self.file.close()
+
+
+class PageCache:
+    """LRU caches of open PDFs and of rendered single-page PDFs"""
+
+    def __init__(self, max_readers=MAX_OPEN_READERS, max_pages=MAX_CACHED_PAGES):
+        self.max_readers = max_readers
+        self.max_pages = max_pages
+        self._readers = OrderedDict()   # (path, mtime, size) -> _OpenPdf
+        self._pages = OrderedDict()     # (path, mtime, size, page) -> {"page", "pdf", "text"}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _file_key(self, path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def _open(self, file_key):
+        with self._lock:
+            pdf = self._readers.get(file_key)
+            if pdf is not None:
+                self._readers.move_to_end(file_key)
+                return pdf
+        pdf = _OpenPdf(file_key[0])
+        evicted = []
+        with self._lock:
+            if file_key in self._readers:
+                # Another thread opened it meanwhile
+                evicted.append(pdf)
+                pdf = self._readers[file_key]
+            else:
+                self._readers[file_key] = pdf
+                while len(self._readers) > self.max_readers:
+                    evicted.append(self._readers.popitem(last=False)[1])
+        for old in evicted:
+            with old.lock:
+                old.close()
+        return pdf
+
+    def _read(self, file_key, fn):
+        """Call fn(reader) under the reader's lock, reopening if it was evicted meanwhile"""
+        while True:
+            pdf = self._open(file_key)
+            with pdf.lock:
+                if not pdf.closed:
+                    return fn(pdf.reader)
+
+    def page_count(self, path):
+        return self._read(self._file_key(path), page_count)
+
+    def page(self, path, number):
+        """Render one page (1-based): {"page", "pdf": bytes of a one-page PDF, "text"}"""
+        file_key = self._file_key(path)
+        key = file_key + (number,)
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        def render(reader):
+            page = find_page(reader, number - 1)
+            writer = PdfWriter()
+            writer.add_page(page)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            return {"page": number, "pdf": buffer.getvalue(), "text": page.extract_text() or ""}
+
+        rendered = self._read(file_key, render)
+        with self._lock:
+            self._pages[key] = rendered
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return rendered
+
+    def view(self, path, number, neighbours=NEIGHBOURS):
+        """The cited page and up to `neighbours` pages either side, in page order"""
+        total = self.page_count(path)
+        number = min(max(1, number), total)
+        first, last = max(1, number - neighbours), min(total, number + neighbours)
+        return [self.page(path, n) for n in range(first, last + 1)]
+
+    def clear(self):
+        with self._lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+            self._pages.clear()
+        for pdf in readers:
+            with pdf.lock:
+                pdf.close()
+
+
+def data_url(pdf_bytes):
+    """Inline data: URL for embedding a rendered page in an iframe"""
+    return "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode("ascii")
+
+
+_default_cache = PageCache()
+
+def view_citation(path, page, neighbours=NEIGHBOURS):
+    """Rendered pages around a cited page, from the process-wide cache"""
+    return _default_cache.view(path, page, neighbours)
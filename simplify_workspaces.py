@@ -0,0 +1,320 @@
+"""Per-tenant workspaces for Simplify.
+
+Each user or team gets its own directory under `root` with its uploads
+and a private Corpus. Usage is tracked per workspace (index memory and
+upload disk bytes) against per-workspace quotas, and the indexes that are
+held in memory share one global budget: when it is exceeded the least
+recently used workspaces are written to disk and dropped from memory,
+then loaded back transparently on their next use.
+
+A saved index is served from its memory-mapped file, so only what was
+ingested since the last save counts against the global budget; the
+per-workspace memory quota still covers the whole index. Short-lived
+workspaces, such as the per-session ones of the chat app, are deleted by
+expire() once they have been idle for long enough.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from simplify_corpus import Corpus, extract_pages
+from simplify_index import load_corpus, open_index, write_index
+
+MB = 1024 * 1024
+
+DEFAULT_MEMORY_BUDGET = 512 * MB      # all resident indexes together
+DEFAULT_WORKSPACE_MEMORY = 128 * MB   # one workspace's index
+DEFAULT_WORKSPACE_DISK = 1024 * MB    # one workspace's uploads
+
+WORKSPACE_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+INDEX_FILE = "index.simx"
+UPLOAD_TEMP_PREFIX = ".upload-"
+
+
+class QuotaExceeded(Exception):
+    """Raised when an ingest would push a workspace past one of its quotas"""
+
+
+class Workspace:
+    """One tenant's uploads directory, index and usage counters"""
+
+    def __init__(self, workspace_id, path):
+        self.id = workspace_id
+        self.path = path
+        self.upload_dir = os.path.join(path, "uploads")
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.corpus = None
+        self.dirty = False
+        self.last_used = time.time()
+        self.lock = threading.RLock()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.disk_bytes = 0
+        for entry in os.scandir(self.upload_dir):
+            if entry.name.startswith(UPLOAD_TEMP_PREFIX):
+                os.remove(entry.path)   # left behind by an ingest that was interrupted
+            elif entry.is_file():
+                self.disk_bytes += entry.stat().st_size
+
+    @property
+    def resident(self):
+        return self.corpus is not None
+
+    @property
+    def memory_bytes(self):
+        """Index bytes held in memory rather than read from the index file"""
+        return self.corpus.resident_bytes if self.corpus is not None else 0
+
+    @property
+    def index_bytes(self):
+        return self.corpus.memory_bytes if self.corpus is not None else 0
+
+    def usage(self):
+        return {
+            "workspace": self.id,
+            "resident": self.resident,
+            "memory_bytes": self.memory_bytes,
+            "index_bytes": self.index_bytes,
+            "disk_bytes": self.disk_bytes,
+            "documents": len(self.corpus.documents) if self.corpus is not None else None,
+            "last_used": self.last_used,
+        }
+
+
+class WorkspaceManager:
+    """Hands out per-tenant corpora and keeps resident indexes under a global memory budget"""
+
+    def __init__(self, root="workspaces", memory_budget=DEFAULT_MEMORY_BUDGET,
+                 workspace_memory=DEFAULT_WORKSPACE_MEMORY, workspace_disk=DEFAULT_WORKSPACE_DISK):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.workspace_memory = workspace_memory
+        self.workspace_disk = workspace_disk
+        self._workspaces = OrderedDict()   # least recently used first
+        self._pending_saves = {}           # workspace id -> Timer of a deferred save
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def workspace(self, workspace_id):
+        """Return the Workspace for an id, creating its directory on first use"""
+        if not WORKSPACE_ID_RE.match(workspace_id or ""):
+            raise ValueError(f"Invalid workspace id: {workspace_id!r}")
+        with self._lock:
+            ws = self._workspaces.get(workspace_id)
+            if ws is None:
+                ws = Workspace(workspace_id, os.path.join(self.root, workspace_id))
+                self._workspaces[workspace_id] = ws
+            self._workspaces.move_to_end(workspace_id)
+            return ws
+
+    def corpus(self, workspace_id):
+        """Return a workspace's Corpus, loading it back from disk if it was evicted"""
+        ws = self.workspace(workspace_id)
+        with ws.lock:
+            ws.last_used = time.time()
+            if ws.corpus is None:
+                ws.corpus = self._load(ws)
+            corpus = ws.corpus
+        self.enforce_budget(keep=workspace_id)
+        return corpus
+
+    def ingest_file(self, workspace_id, name, data=None):
+        """Store uploaded bytes in the workspace and index them.
+
+        With no data the file must already be in the workspace's uploads.
+        New bytes are written to a temporary file and only replace the
+        upload once they are indexed, so an upload that is refused or
+        cannot be read leaves the previous version and the disk usage as
+        they were.
+        """
+        ws = self.workspace(workspace_id)
+        name = os.path.basename(name)
+        file_path = os.path.join(ws.upload_dir, name)
+        if data is None:
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f"No upload named {name!r} in workspace '{workspace_id}'")
+            with ws.lock:
+                return self._index(ws, name, extract_pages(file_path, name), file_path)
+        with ws.lock:
+            previous = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            if ws.disk_bytes - previous + len(data) > self.workspace_disk:
+                raise QuotaExceeded(f"Workspace '{workspace_id}' would exceed its "
+                                    f"{self.workspace_disk / MB:.1f} MB disk quota")
+            # Keep the extension: it picks the parser
+            fd, temp_path = tempfile.mkstemp(dir=ws.upload_dir, prefix=UPLOAD_TEMP_PREFIX,
+                                             suffix=os.path.splitext(name)[1])
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                ids = self._index(ws, name, extract_pages(temp_path, name), file_path)
+                os.replace(temp_path, file_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            ws.disk_bytes += len(data) - previous
+            return ids
+
+    def ingest_text(self, workspace_id, name, text):
+        """Index raw text in the workspace without storing a file"""
+        ws = self.workspace(workspace_id)
+        with ws.lock:
+            return self._index(ws, name, text)
+
+    def _index(self, ws, name, pages, path=None):
+        corpus = self.corpus(ws.id)
+
+        def admit(projected):
+            # Checked before the document is embedded and before it is published
+            if projected > self.workspace_memory:
+                raise QuotaExceeded(f"Workspace '{ws.id}' would exceed its "
+                                    f"{self.workspace_memory / MB:.1f} MB memory quota "
+                                    f"({corpus.memory_bytes / MB:.1f} MB in use)")
+
+        ids = corpus.add_document(name, pages, path=path, admit=admit)
+        ws.dirty = True
+        self.enforce_budget(keep=ws.id)
+        return ids
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(ws.memory_bytes for ws in self._workspaces.values())
+
+    def enforce_budget(self, keep=None):
+        """Evict least recently used indexes to disk until resident memory fits the budget"""
+        with self._lock:
+            candidates = [ws for ws in self._workspaces.values() if ws.resident and ws.id != keep]
+            total = sum(ws.memory_bytes for ws in self._workspaces.values())
+        for ws in candidates:
+            if total <= self.memory_budget:
+                break
+            # Skip workspaces busy in another thread rather than wait on them
+            total -= self.evict(ws.id, blocking=False)
+
+    def evict(self, workspace_id, blocking=True):
+        """Persist a workspace's index and drop it from memory; returns bytes freed"""
+        with self._lock:
+            ws = self._workspaces.get(workspace_id)
+        if ws is None:
+            return 0
+        if not ws.lock.acquire(blocking=blocking):
+            return 0
+        try:
+            if ws.corpus is None:
+                return 0
+            freed = ws.memory_bytes
+            if ws.dirty or not os.path.exists(ws.index_path):
+                self._save(ws)
+            ws.corpus = None
+            return freed
+        finally:
+            ws.lock.release()
+
+    def delete(self, workspace_id):
+        """Remove a workspace's index and uploads from memory and disk"""
+        ws = self.workspace(workspace_id)
+        with self._lock:
+            timer = self._pending_saves.pop(workspace_id, None)
+        if timer is not None:
+            timer.cancel()
+        with ws.lock:
+            ws.corpus = None
+            shutil.rmtree(ws.path, ignore_errors=True)
+        with self._lock:
+            self._workspaces.pop(workspace_id, None)
+
+    def expire(self, max_idle, prefix=""):
+        """Delete the workspaces under root whose id starts with prefix and that
+        have not been used for max_idle seconds; returns their ids.
+
+        Workspaces not opened by this process are judged by when their
+        files last changed.
+        """
+        cutoff = time.time() - max_idle
+        with self._lock:
+            last_used = {workspace_id: ws.last_used for workspace_id, ws in self._workspaces.items()}
+        expired = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or not entry.name.startswith(prefix) or not WORKSPACE_ID_RE.match(entry.name):
+                continue
+            used = last_used.get(entry.name)
+            if used is None:
+                used = max(os.stat(path).st_mtime for path in (entry.path, os.path.join(entry.path, "uploads"),
+                                                               os.path.join(entry.path, INDEX_FILE))
+                           if os.path.exists(path))
+            if used < cutoff:
+                self.delete(entry.name)
+                expired.append(entry.name)
+        return expired
+
+    def save(self, workspace_id, delay=None):
+        """Write one workspace's index to disk if it changed since it was last written.
+
+        With a delay the write happens that many seconds later on a
+        background thread, and saves asked for in the meantime are folded
+        into it, so a run of ingests rewrites the index once.
+        """
+        if delay is not None:
+            with self._lock:
+                if workspace_id in self._pending_saves:
+                    return
+                timer = threading.Timer(delay, self._deferred_save, (workspace_id,))
+                self._pending_saves[workspace_id] = timer
+            timer.start()
+            return
+        with self._lock:
+            ws = self._workspaces.get(workspace_id)
+        if ws is None:
+            return
+        with ws.lock:
+            if ws.corpus is not None and ws.dirty:
+                self._save(ws)
+
+    def _deferred_save(self, workspace_id):
+        with self._lock:
+            self._pending_saves.pop(workspace_id, None)
+        self.save(workspace_id)
+
+    def flush(self):
+        """Write every resident, modified index to disk"""
+        with self._lock:
+            workspace_ids = list(self._workspaces)
+        for workspace_id in workspace_ids:
+            self.save(workspace_id)
+
+    def usage(self):
+        """Usage of every known workspace plus the global totals"""
+        with self._lock:
+            workspaces = [ws.usage() for ws in self._workspaces.values()]
+        return {
+            "memory_budget": self.memory_budget,
+            "resident_bytes": sum(w["memory_bytes"] for w in workspaces),
+            "workspaces": workspaces,
+        }
+
+    def _save(self, ws):
+        remap = write_index(ws.corpus, ws.index_path)
+        # Serve from the new file so the in-memory delta can be let go
+        index = open_index(ws.index_path)
+        if ws.corpus.rebase(index, remap):
+            ws.dirty = False
+        else:   # changed while it was being written
+            index.close()
+
+    def _load(self, ws):
+        if not os.path.exists(ws.index_path):
+            return Corpus()
+        return load_corpus(ws.index_path)
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+def default_manager():
+    """The process-wide WorkspaceManager shared by the apps, the API and tooling"""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = WorkspaceManager()
+        return _default_manager
@@ -0,0 +1,156 @@
+"""Tests for the local HTTP API against a live server on a free port (run with pytest)"""
+import asyncio
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+
+import pytest
+
+from simplify_api import SimplifyAPI
+from simplify_corpus import Corpus
+
+WORDS = "dna methylation immune response radiation magnesium sulfate cohort tissue liver retina".split()
+
+
+def text(seed):
+    rng = random.Random(seed)
+    return ". ".join(" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(60)) + f" unique{seed}."
+
+
+class Server:
+    """A SimplifyAPI served from its own event loop thread"""
+
+    def __init__(self, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        corpus = Corpus()
+        for i in range(4):
+            corpus.add_document(f"d{i}.txt", text(i))
+        self.api = SimplifyAPI(corpus, **kwargs)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.host, self.port = self.call(self.api.start("127.0.0.1", 0))
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(10)
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=10)
+
+    def post(self, path, payload, conn=None):
+        conn = conn or self.connect()
+        conn.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    def raw(self, data):
+        with socket.create_connection((self.host, self.port), timeout=10) as sock:
+            sock.sendall(data)
+            reply = b""
+            while chunk := sock.recv(65536):
+                reply += chunk
+        return int(reply.split(b" ", 2)[1])
+
+    def close(self):
+        self.call(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+        self.loop.close()
+
+    async def _shutdown(self):
+        await self.api.close()
+        # Kept-alive connections would otherwise wait out their idle timeout
+        connections = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in connections:
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    yield server
+    server.close()
+
+
+def request(method, path, body=b""):
+    return f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+
+
+def test_connection_is_kept_alive_between_requests(server):
+    conn = server.connect()
+    assert server.post("/query", {"query": "dna methylation"}, conn)[0] == 200
+    sock = conn.sock
+    status, body = server.post("/query", {"query": "immune response", "k": 2}, conn)
+    assert status == 200 and len(body["citations"]) == 2
+    assert conn.sock is sock   # http.client reconnects if the server closed it
+    conn.close()
+
+
+@pytest.mark.parametrize("data", [
+    b"POST /query HTTP/1.1\r\nContent-Length: abc\r\n\r\n",
+    b"POST /query HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+    b"GET /" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n",
+    request("POST", "/query", b"{not json"),
+    request("POST", "/query", b"[1, 2]"),
+    request("POST", "/query", json.dumps({"query": "dna", "k": "x"}).encode()),
+    request("POST", "/query", json.dumps({"query": "dna", "budget_ms": "fast"}).encode()),
+    request("POST", "/query", json.dumps({"query": "dna", "documents": "d1.txt"}).encode()),
+    request("POST", "/query", json.dumps({"query": 5}).encode()),
+    request("POST", "/summarize", json.dumps({"sentences": -1}).encode()),
+    request("POST", "/batch", json.dumps({"questions": ["dna"], "k": 0}).encode()),
+    request("POST", "/ingest", json.dumps({"name": 3, "text": "dna"}).encode()),
+])
+def test_malformed_requests_get_400(server, data):
+    assert server.raw(data) == 400
+
+
+def test_busy_server_refuses_with_503():
+    server = Server(max_concurrency=1, max_pending=1)
+    release = asyncio.Event()
+
+    async def slow(payload):
+        await release.wait()
+        return {"slow": True}
+
+    server.api.routes[("POST", "/slow")] = slow
+    try:
+        held = server.connect()
+        held.request("POST", "/slow", "{}")
+        deadline = time.time() + 5
+        while not server.api._pending and time.time() < deadline:
+            time.sleep(0.01)
+        status, body = server.post("/query", {"query": "dna"})
+        assert status == 503 and "busy" in body["error"]
+        server.loop.call_soon_threadsafe(release.set)
+        assert held.getresponse().status == 200
+        assert server.post("/query", {"query": "dna"})[0] == 200
+    finally:
+        server.close()
+
+
+def test_queries_see_one_version_while_documents_are_replaced(server):
+    stop = time.time() + 1.5
+    statuses = []
+
+    def ask():
+        conn = server.connect()
+        while time.time() < stop:
+            statuses.append(server.post("/query", {"query": "dna methylation immune"}, conn)[0])
+            statuses.append(server.post("/batch", {"questions": ["dna methylation"], "k": 2}, conn)[0])
+        conn.close()
+
+    readers = [threading.Thread(target=ask) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    rng = random.Random(0)
+    while time.time() < stop:
+        name = f"d{rng.randrange(4)}.txt"
+        if rng.random() < 0.3:
+            server.api.corpus.remove_document(name)
+        server.api.corpus.add_document(name, text(rng.randrange(100)))
+    for reader in readers:
+        reader.join()
+    assert statuses and set(statuses) == {200}
@@ -0,0 +1,43 @@
+"""Follow-up expansion tests for the conversation context (run with pytest)"""
+import pytest
+
+from simplify_context import ConversationContext
+from simplify_corpus import Corpus
+from simplify_retrieval import planner_for
+
+EPIGENOMICS = ("The epigenomic regulators Tet2 and Dnmt3a differentially condition the spaceflight "
+               "response of genome DNA methylation in mouse liver. ")
+MARS = "Hydrated magnesium sulfate minerals reach a maximum concentration of 30 percent in Martian soil. "
+
+
+@pytest.fixture
+def corpus():
+    corpus = Corpus()
+    corpus.add_document("epi.txt", EPIGENOMICS * 40)
+    corpus.add_document("mars.txt", MARS * 40)
+    return corpus
+
+
+def ask(context, corpus, question):
+    context.add_turn("user", question)
+    query = context.follow_up_query(question)
+    result = planner_for(corpus).retrieve(query, k=3)
+    top = result.corpus.chunks[result.hits[0][0]]["doc"]
+    context.add_turn("ai", f"From {top}.")
+    return query, top
+
+
+def test_follow_up_borrows_the_topic_of_earlier_questions(corpus):
+    context = ConversationContext()
+    ask(context, corpus, "How do Tet2 and Dnmt3a change DNA methylation during spaceflight?")
+    query, top = ask(context, corpus, "What about in the liver?")
+    assert "tet2" in query and top == "epi.txt"
+
+
+def test_new_topic_is_not_pulled_back_to_the_old_one(corpus):
+    context = ConversationContext()
+    ask(context, corpus, "How do Tet2 and Dnmt3a change DNA methylation during spaceflight?")
+    ask(context, corpus, "Which epigenomic regulator matters more, Tet2 or Dnmt3a?")
+    question = "What maximum concentration can magnesium sulfate reach?"
+    query, top = ask(context, corpus, question)
+    assert query == question and top == "mars.txt"
@@ -0,0 +1,121 @@
+"""Round-trip tests for the on-disk index format (run with pytest)"""
+from collections import Counter
+
+import pytest
+
+from simplify_corpus import Corpus, tokenize
+from simplify_index import (IndexFormatError, decode_postings, encode_postings, load_corpus,
+                            open_index, write_index)
+
+PAGES = [(1, "Spaceflight alters genome DNA methylation in mouse liver. " * 60),
+         (2, "Immune response to deep space radiation. " * 80)]
+QUERY = "magnesium sulfate maximum concentration"
+
+
+@pytest.fixture
+def corpus():
+    corpus = Corpus()
+    corpus.add_document("a.txt", PAGES)
+    corpus.add_document("a copy.txt", PAGES)
+    corpus.add_document("b.txt", "Hydrated magnesium sulfate concentrations on Mars. " * 90)
+    corpus.remove_document("b.txt")
+    corpus.add_document("b.txt", "Hydrated magnesium sulfate minerals reach a maximum concentration. " * 90)
+    return corpus
+
+
+@pytest.fixture
+def path(corpus, tmp_path):
+    path = str(tmp_path / "roundtrip.simx")
+    write_index(corpus, path)
+    return path
+
+
+def ranked(corpus, hits):
+    return [(corpus.chunks[i]["doc"], round(score, 6)) for i, score in hits]
+
+
+def test_postings_round_trip():
+    postings = {0: 3, 7: 1, 128: 2, 100000: 5}
+    assert decode_postings(encode_postings(postings)) == postings
+
+
+def test_mapped_index_answers_like_the_corpus(corpus, path):
+    with open_index(path) as index:
+        assert ranked(index, index.search(QUERY)) == ranked(corpus, corpus.search(QUERY))
+        assert index.document_text("a copy.txt") == corpus.document_text("a.txt")
+
+
+def test_load_corpus_answers_like_the_corpus(corpus, path):
+    loaded = load_corpus(path)
+    assert ranked(loaded, loaded.search(QUERY)) == ranked(corpus, corpus.search(QUERY))
+    assert [loaded.chunks[i]["doc"] for i, _ in loaded.dense_search(QUERY)] == \
+        [corpus.chunks[i]["doc"] for i, _ in corpus.dense_search(QUERY)]
+    assert loaded.duplicates == corpus.duplicates
+    assert sorted(loaded.postings) == sorted(corpus.postings)
+    assert Counter(tokenize(loaded.summarize())) == Counter(tokenize(corpus.summarize()))
+
+
+def test_loaded_corpus_still_deduplicates(path):
+    assert load_corpus(path).add_document("a again.txt", PAGES) == []
+
+
+def test_changes_after_loading_survive_a_rewrite(path, tmp_path):
+    loaded = load_corpus(path)
+    loaded.remove_document("a.txt")
+    loaded.add_document("c.txt", "Perchlorate salts lower the freezing point of brine. " * 50)
+    expected = ranked(loaded, loaded.search("perchlorate brine genome"))
+    rewritten = str(tmp_path / "rewritten.simx")
+    remap = write_index(loaded, rewritten)
+    assert remap is not None   # a.txt's chunks were compacted away
+    assert loaded.rebase(open_index(rewritten), remap)
+    assert ranked(loaded, loaded.search("perchlorate brine genome")) == expected
+    assert "a.txt" not in load_corpus(rewritten).documents
+
+
+def test_rejects_files_that_are_not_indexes(tmp_path):
+    bogus = tmp_path / "bogus.simx"
+    bogus.write_bytes(b"not an index at all, just some bytes")
+    with pytest.raises(IndexFormatError):
+        open_index(str(bogus))
+
+
+def test_document_filter_finds_passages_shared_with_other_documents(tmp_path):
+    shared = "Hydrated magnesium sulfate minerals reach a maximum concentration in regolith. " * 30
+    corpus = Corpus()
+    corpus.add_document("v1.txt", [(1, "Orbital imaging of the northern plains. " * 40), (2, shared)])
+    corpus.add_document("v2.txt", [(1, "Spectrometer calibration before launch. " * 40), (2, shared)])
+    path = str(tmp_path / "shared.simx")
+    write_index(corpus, path)
+    with open_index(path) as index:
+        for searched in (corpus, index, load_corpus(path)):
+            for search in (searched.search, searched.dense_search):
+                hits = search(QUERY, docs=["v2.txt"])
+                assert hits and {searched.chunks[i]["doc"] for i, _ in hits} == {"v2.txt"}
+
+
+def test_replacing_a_document_promotes_its_alias(tmp_path):
+    alias = tmp_path / "b.txt"
+    alias.write_text("Hydrated magnesium sulfate minerals reach a maximum concentration. " * 90)
+    corpus = Corpus()
+    corpus.add_document("a.txt", alias.read_text())
+    assert corpus.add_file(str(alias)) == []
+    path = str(tmp_path / "aliased.simx")
+    write_index(corpus, path)
+    for replaced in (corpus, load_corpus(path)):
+        replaced.add_document("a.txt", "Perchlorate salts lower the freezing point of brine. " * 50)
+        assert sorted(replaced.documents) == ["a.txt", "b.txt"]
+        assert replaced.documents["b.txt"]["path"] == str(alias)
+        assert replaced.duplicates == {}
+        assert {replaced.chunks[i]["doc"] for i, _ in replaced.search(QUERY)} == {"b.txt"}
+
+
+def test_removing_documents_and_aliases(corpus):
+    corpus.add_document("a third copy.txt", PAGES)
+    corpus.remove_document("a.txt")
+    assert "a copy.txt" in corpus.documents
+    assert corpus.duplicates == {"a third copy.txt": "a copy.txt"}
+    assert corpus.document_text("a third copy.txt") == corpus.document_text("a copy.txt")
+    version = corpus.version
+    corpus.remove_document("a third copy.txt")
+    assert corpus.duplicates == {}
+    assert corpus.version > version